@@ -0,0 +1,201 @@
+#
+# Retro Roaming benchmarks - times the library model on synthetic libraries of different sizes.
+#
+# python benchmarks/bench_library.py --sizes 1000 10000 100000 1000000 --output results.json
+#
+# Each operation is run headless against retro_core.DataManager, the results give wall time,
+# peak memory allocated by the operation and throughput, and can be written as JSON so runs
+# from different versions can be compared.
+#
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import retro_core  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+WORDS = ['Manic', 'Miner', 'Jet', 'Set', 'Willy', 'Skool', 'Daze', 'Elite', 'Knight', 'Lore', 'Chuckie',
+         'Egg', 'Head', 'Heels', 'Dizzy', 'Treasure', 'Island', 'Commando', 'Paperboy', 'Doom', 'Keen']
+
+
+def generate_library(folder, size, emulators=30, seed=1):
+    """Write emu_data.json and games_data.json holding size games spread over the emulators."""
+    rng = random.Random(seed)
+    notes_store = retro_core.NotesStore(os.path.join(folder, 'notes'))
+    emu_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(emulators)]
+    emu_dict = {emu_id: {'Name': f"Emulator {n:02d}",
+                         'Location': f'"C:\\Emulators\\Emulator {n:02d}\\emu.exe"',
+                         'Library_default': f"D:\\Library\\Emulator {n:02d}",
+                         'Default_option': '-fullscreen',
+                         'Working_Directory': f"C:\\Emulators\\Emulator {n:02d}"}
+                for n, emu_id in enumerate(emu_ids)}
+    games_dict = {}
+    for n in range(size):
+        emu_id = emu_ids[n % emulators]
+        emu_name = emu_dict[emu_id]['Name']
+        game_name = f"{' '.join(rng.sample(WORDS, 2))} {n:07d}"
+        games_dict[str(uuid.UUID(int=rng.getrandbits(128)))] = {
+            'Game': game_name,
+            'Emulator_id': emu_id,
+            'Options': f' "D:\\Library\\{emu_name}\\game{n:07d}.tzx" -fullscreen',
+            'Notes_key': notes_store.put(' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 30))))
+        }
+    with open(os.path.join(folder, 'emu_data.json'), 'w') as ef:
+        json.dump(emu_dict, ef, indent=4)
+    with open(os.path.join(folder, 'games_data.json'), 'w') as gf:
+        json.dump(games_dict, gf, indent=4)
+    notes_store.flush()
+    return emu_ids, games_dict
+
+
+def measure(results, size, operation, func, items, trace_memory):
+    """Run func once and record its wall time, peak traced memory and throughput."""
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    func()
+    wall = time.perf_counter() - started
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result = {'size': size, 'operation': operation, 'wall_s': round(wall, 6), 'peak_bytes': peak,
+              'items': items, 'per_second': round(items / wall, 1) if wall > 0 else None}
+    results.append(result)
+    peak_text = f"{peak / 1048576:10.1f} MB" if peak is not None else "          -"
+    print(f"{size:>9} {operation:<28}{wall:10.4f} s{peak_text}{result['per_second'] or 0:14.0f} /s")
+
+
+def run_size(size, storage, trace_memory, results):
+    folder = tempfile.mkdtemp(prefix=f"retro_bench_{size}_")
+    try:
+        emu_ids, games_dict = generate_library(folder, size)
+        os.environ['RETROROAMING_STORAGE'] = storage
+        if storage != 'json':
+            # Migration from the JSON files happens once, outside the timings
+            retro_core.DataManager(datastorelocation=folder).close()
+
+        holder = {}
+        if storage != 'json':
+            def lazy_load():
+                dm = retro_core.DataManager(load=False, datastorelocation=folder)
+                dm.load(lazy=True)
+                holder['lazy'] = dm
+            measure(results, size, 'load_data (lazy)', lazy_load, size, trace_memory)
+            lazy_dm = holder['lazy']
+            other_emu = next(emu for emu in emu_ids if not lazy_dm.storage.is_loaded(emu))
+
+            def load_emulator():
+                lazy_dm.load_emulator(other_emu)
+            measure(results, size, 'load_emulator', load_emulator, size // len(emu_ids), trace_memory)
+            lazy_dm.close()
+
+        def load():
+            holder['dm'] = retro_core.DataManager(datastorelocation=folder)
+        measure(results, size, 'load_data', load, size, trace_memory)
+        dm = holder['dm']
+
+        emu_id = emu_ids[0]
+        emu_games = len(dm.games_for_emulator(emu_id))
+
+        def filter_games():
+            # The same work filter_the_games and the list control do when the emulator changes
+            sorted(dm.games_for_emulator(emu_id), key=lambda game_id: dm.games_dict[game_id]['Game'])
+        measure(results, size, 'filter_the_games', filter_games, emu_games, trace_memory)
+
+        names = [(details['Emulator_id'], details['Game']) for details in list(games_dict.values())[:1000]]
+
+        def duplicate_checks():
+            for name in names:
+                dm.find_game(*name)
+        measure(results, size, 'duplicate_check x1000', duplicate_checks, len(names), trace_memory)
+
+        def search():
+            dm.search('dizzy elite')
+        measure(results, size, 'search', search, size, trace_memory)
+
+        shown = list(dm.games_dict)[:1000]
+
+        def show_notes():
+            # What on_list_select reads as games are picked in the list
+            for game_id in shown:
+                dm.notes(game_id)
+        measure(results, size, 'show notes x1000', show_notes, len(shown), trace_memory)
+
+        def index_notes():
+            dm.index_notes()
+        measure(results, size, 'index_notes', index_notes, size, trace_memory)
+
+        game_id = next(iter(dm.games_dict))
+
+        def save_one():
+            dm.update_game(game_id, Notes='Edited by the benchmark')
+            dm.write_changes()
+        measure(results, size, 'save_data (one edit)', save_one, 1, trace_memory)
+
+        def save_all():
+            dm.changed_emus.update(dm.emu_dict)
+            dm.changed_games.update(dm.games_dict)
+            dm.write_changes()
+        measure(results, size, 'save_data (everything)', save_all, size, trace_memory)
+
+        def rename():
+            dm.rename_emulator(emu_id, 'Renamed Emulator')
+            dm.write_changes()
+        measure(results, size, 'rename emulator + save', rename, 1, trace_memory)
+
+        def delete():
+            dm.delete_emulator(emu_id)
+            dm.write_changes()
+        measure(results, size, 'delete emulator + save', delete, emu_games, trace_memory)
+        dm.close()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Retro Roaming library model")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="number of games in each library")
+    parser.add_argument('--storage', choices=['json', 'sqlite', 'sharded'], default='json')
+    parser.add_argument('--no-memory', action='store_true',
+                        help="don't trace memory, tracing slows every operation down")
+    parser.add_argument('--label', default=None, help="name for this run in the results, e.g. a version number")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'size':>9} {'operation':<28}{'wall':>12}{'peak':>13}{'throughput':>16}")
+    for size in args.sizes:
+        run_size(size, args.storage, not args.no_memory, results)
+
+    if args.output:
+        report = {'label': args.label, 'version': git_version(), 'storage': args.storage,
+                  'memory_traced': not args.no_memory, 'python': platform.python_version(),
+                  'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'results': results}
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,85 +3,292 @@
 # Update Nov 2023 - add status bar details 1.01
 # Update Feb 2026 - code cleanup and robustness improvements
 #
+import time
+STARTUP_STARTED = time.perf_counter()
 import wx
+# (stage, seconds) for the startup timing breakdown printed by --timings,
+# stages ending in 'at' are measured from the start of the program
+STARTUP_TIMES = [('import wx', time.perf_counter() - STARTUP_STARTED)]
 import os
-import subprocess
-import json
-import uuid
-
-
-class DataManager:
-    def __init__(self):
-        """Initialize the data storage location and load existing data."""
-        self.datastorelocation = os.path.join(os.getenv("LOCALAPPDATA", os.path.expanduser("~")), "RetroRoaming")
-        if not os.path.exists(self.datastorelocation):
-            try:
-                os.makedirs(self.datastorelocation)
-            except OSError as e:
-                wx.MessageBox(f"Could not create data directory: {e}", "Error", wx.OK | wx.ICON_ERROR)
-
-        self.emu_file = os.path.join(self.datastorelocation, 'emu_data.json')
-        self.game_file = os.path.join(self.datastorelocation, 'games_data.json')
-        self.emu_dict = {}
-        self.games_dict = {}
-        self.load_data()
-
-    def load_data(self):
-        """Load emulator and game data from JSON files."""
-        if os.path.isfile(self.emu_file):
-            try:
-                with open(self.emu_file, 'r') as ef:
-                    self.emu_dict = json.load(ef)
-            except (json.JSONDecodeError, IOError) as e:
-                wx.MessageBox(f"Error loading emulator data: {e}", "Error", wx.OK | wx.ICON_ERROR)
-
-        if os.path.isfile(self.game_file):
-            try:
-                with open(self.game_file, 'r') as gf:
-                    self.games_dict = json.load(gf)
-            except (json.JSONDecodeError, IOError) as e:
-                wx.MessageBox(f"Error loading game data: {e}", "Error", wx.OK | wx.ICON_ERROR)
+import sys
+import threading
+from retro_core import (ContentHasher, DataManager, LaunchManager, LaunchTester, LibraryScanner, PathChecker,
+                        Prefetcher, build_command, default_data_location)
+import retro_perf
+from retro_perf import timed
+
+
+class GameListCtrl(wx.ListCtrl):
+    """Virtual list of games, rows are drawn on demand from a sorted list of game ids."""
+
+    COLUMNS = [('Name', 'Game', 300), ('Emulator', 'Emulator_id', 150), ('Last Played', 'Last_played', 150),
+               ('Last Test', 'Test_result', 250)]
+
+    def __init__(self, parent, games_dict, emulator_name):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+        self.games_dict = games_dict
+        # emulator_name(emulator id) gives the name shown in the Emulator column
+        self.emulator_name = emulator_name
+        # Games with missing files by id, drawn in red along with games that failed their launch test
+        self.broken = {}
+        self.broken_attr = wx.ItemAttr()
+        self.broken_attr.SetTextColour(wx.RED)
+        self.game_ids = []
+        self.positions = {}
+        self.sort_column = 0
+        self.sort_descending = False
+        for col, (label, _key, width) in enumerate(self.COLUMNS):
+            self.InsertColumn(col, label, width=width)
+        self.Bind(wx.EVT_LIST_COL_CLICK, self.on_col_click)
+
+    def OnGetItemText(self, item, col):
+        return self.column_text(self.game_ids[item], self.COLUMNS[col][1])
+
+    def OnGetItemAttr(self, item):
+        game_id = self.game_ids[item]
+        if game_id in self.broken or self.games_dict[game_id].get('Test_failed'):
+            return self.broken_attr
+        return None
+
+    def column_text(self, game_id, key):
+        details = self.games_dict[game_id]
+        if key == 'Emulator_id':
+            return self.emulator_name(details['Emulator_id'])
+        return details.get(key, '')
+
+    def set_games(self, game_ids):
+        """Replace the games shown, keeping the current sort order."""
+        self.game_ids = list(game_ids)
+        self._sort()
+
+    def _sort(self):
+        key = self.COLUMNS[self.sort_column][1]
+        self.game_ids.sort(key=lambda game_id: (self.column_text(game_id, key), self.games_dict[game_id]['Game']),
+                           reverse=self.sort_descending)
+        self.positions = {game_id: pos for pos, game_id in enumerate(self.game_ids)}
+        selected = self.GetFirstSelected()
+        if selected != -1:
+            self.Select(selected, False)
+        self.SetItemCount(len(self.game_ids))
+        self.Refresh()
+
+    def on_col_click(self, event):
+        """Sort on the clicked column, clicking again reverses the order."""
+        selected_id = self.selected_game_id()
+        col = event.GetColumn()
+        if col == self.sort_column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = col
+            self.sort_descending = False
+        self._sort()
+        if selected_id:
+            self.select_game(selected_id)
+
+    def selected_game_id(self):
+        """Return the id of the selected game or an empty string."""
+        selected = self.GetFirstSelected()
+        if selected == -1:
+            return ''
+        return self.game_ids[selected]
+
+    def select_game(self, game_id):
+        """Select the row for a game id, returns False if it isn't in the list."""
+        pos = self.positions.get(game_id)
+        if pos is None:
+            return False
+        self.Select(pos)
+        self.Focus(pos)
+        self.EnsureVisible(pos)
+        return True
+
+
+class PerformanceDialog(wx.Dialog):
+    """Live view of the performance counters, refreshed every second."""
+
+    def __init__(self, parent):
+        super().__init__(parent, title='Performance', size=(760, 500),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.text = wx.TextCtrl(self, style=wx.TE_MULTILINE | wx.TE_READONLY | wx.HSCROLL)
+        self.text.SetFont(wx.Font(9, wx.FONTFAMILY_TELETYPE, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+        reset_btn = wx.Button(self, label='Reset')
+        close_btn = wx.Button(self, wx.ID_CLOSE)
+        reset_btn.Bind(wx.EVT_BUTTON, self.on_reset)
+        close_btn.Bind(wx.EVT_BUTTON, lambda event: self.Close())
 
-    def save_data(self):
-        """Save emulator and game data to JSON files."""
-        try:
-            with open(self.emu_file, 'w') as ef:
-                json.dump(self.emu_dict, ef, indent=4)
-            with open(self.game_file, 'w') as gf:
-                json.dump(self.games_dict, gf, indent=4)
-        except IOError as e:
-            wx.MessageBox(f"Error saving data: {e}", "Error", wx.OK | wx.ICON_ERROR)
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        button_sizer.Add(reset_btn, 0, wx.ALL, 5)
+        button_sizer.Add(close_btn, 0, wx.ALL, 5)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.text, 1, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(button_sizer, 0, wx.CENTER)
+        self.SetSizer(sizer)
+
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_refresh, self.timer)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        self.timer.Start(1000)
+        self.on_refresh(None)
+
+    def on_refresh(self, event):
+        self.text.ChangeValue(retro_perf.stats.summary())
+
+    def on_reset(self, event):
+        retro_perf.stats.reset()
+        self.on_refresh(None)
+
+    def on_close(self, event):
+        self.timer.Stop()
+        self.Destroy()
+
+
+class DuplicatesDialog(wx.Dialog):
+    """Games whose files have the same contents, double clicking a game shows it in the main window."""
+
+    def __init__(self, parent, groups, games_dict, emulator_name, on_show_game):
+        super().__init__(parent, title='Duplicate Games', size=(900, 500),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.on_show_game = on_show_game
+        self.game_ids = []
+        self.list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for col, (label, width) in enumerate([('Set', 50), ('Name', 250), ('Emulator', 150), ('File', 420)]):
+            self.list.InsertColumn(col, label, width=width)
+        for number, (_sha1, _size, members) in enumerate(groups, 1):
+            for game_id, path in members:
+                if game_id not in games_dict:
+                    continue
+                row = self.list.InsertItem(self.list.GetItemCount(), str(number))
+                self.list.SetItem(row, 1, games_dict[game_id]['Game'])
+                self.list.SetItem(row, 2, emulator_name(games_dict[game_id]['Emulator_id']))
+                self.list.SetItem(row, 3, path)
+                self.game_ids.append(game_id)
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activate)
+        close_btn = wx.Button(self, wx.ID_CLOSE)
+        close_btn.Bind(wx.EVT_BUTTON, lambda event: self.Destroy())
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(wx.StaticText(self, label=f"{len(groups)} sets of games share the same file contents"),
+                  0, wx.ALL, 5)
+        sizer.Add(self.list, 1, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(close_btn, 0, wx.CENTER | wx.ALL, 5)
+        self.SetSizer(sizer)
+
+    def on_activate(self, event):
+        self.on_show_game(self.game_ids[event.GetIndex()])
+
+
+class LaunchTestSettingsDialog(wx.Dialog):
+    """Asks which games to test, how long each must keep running and how many start at once."""
+
+    def __init__(self, parent, listed_count):
+        super().__init__(parent, title='Test Launch Games')
+        self.timeout = wx.SpinCtrl(self, min=1, max=600, initial=10)
+        self.workers = wx.SpinCtrl(self, min=1, max=32, initial=4)
+        self.scope = wx.RadioBox(self, label='Games to test', style=wx.RA_SPECIFY_ROWS,
+                                 choices=[f"The {listed_count} games in the list", "Every game in the library"])
+        grid = wx.FlexGridSizer(2, 5, 5)
+        grid.Add(wx.StaticText(self, label="Seconds each game must keep running:"), 0, wx.ALIGN_CENTER_VERTICAL)
+        grid.Add(self.timeout)
+        grid.Add(wx.StaticText(self, label="Games started at the same time:"), 0, wx.ALIGN_CENTER_VERTICAL)
+        grid.Add(self.workers)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(grid, 0, wx.ALL, 10)
+        sizer.Add(self.scope, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 10)
+        sizer.Add(self.CreateButtonSizer(wx.OK | wx.CANCEL), 0, wx.EXPAND | wx.ALL, 10)
+        self.SetSizerAndFit(sizer)
+
+
+class LaunchTestDialog(wx.Dialog):
+    """Report of a launch test, failed games first, double clicking a game shows it in the main window."""
+
+    def __init__(self, parent, results, games_dict, emulator_name, on_show_game):
+        super().__init__(parent, title='Launch Test', size=(900, 500),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.on_show_game = on_show_game
+        self.game_ids = [game_id for game_id in results if game_id in games_dict]
+        self.game_ids.sort(key=lambda game_id: (results[game_id][0], games_dict[game_id]['Game']))
+        self.list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for col, (label, width) in enumerate([('Result', 70), ('Name', 250), ('Emulator', 150), ('Details', 400)]):
+            self.list.InsertColumn(col, label, width=width)
+        for game_id in self.game_ids:
+            passed, result = results[game_id]
+            row = self.list.InsertItem(self.list.GetItemCount(), 'Passed' if passed else 'Failed')
+            self.list.SetItem(row, 1, games_dict[game_id]['Game'])
+            self.list.SetItem(row, 2, emulator_name(games_dict[game_id]['Emulator_id']))
+            self.list.SetItem(row, 3, result)
+            if not passed:
+                self.list.SetItemTextColour(row, wx.RED)
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activate)
+        close_btn = wx.Button(self, wx.ID_CLOSE)
+        close_btn.Bind(wx.EVT_BUTTON, lambda event: self.Destroy())
+
+        failed = sum(not passed for passed, _result in results.values())
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(wx.StaticText(self, label=f"{failed} of {len(results)} games failed to launch"), 0, wx.ALL, 5)
+        sizer.Add(self.list, 1, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(close_btn, 0, wx.CENTER | wx.ALL, 5)
+        self.SetSizer(sizer)
+
+    def on_activate(self, event):
+        self.on_show_game(self.game_ids[event.GetIndex()])
+
+
+SHELL_LAUNCH_QUESTION = ("Start games through the command prompt?\n\n"
+                         "Games normally start the emulator directly, only say Yes if the emulator "
+                         "or its options need the command prompt to run.")
 
 
 class MyFrame(wx.Frame):
 
-    def __init__(self):
+    def __init__(self, show_timings=False):
+        frame_started = time.perf_counter()
         super().__init__(parent=None, title='Retro Roaming', size=(1200, 800))
-        self.data_manager = DataManager()
+        # Started first so the threads DataManager starts, such as the writer, are profiled too
+        self.profile = retro_perf.SessionProfile(default_data_location())
+        # The library is loaded on a background thread once the window is showing
+        self.data_manager = DataManager(load=False, on_error=self.show_error)
+        self.launch_manager = LaunchManager(self.on_game_finished)
         self.emu_dict = self.data_manager.emu_dict
         self.games_dict = self.data_manager.games_dict
+        self.show_timings = show_timings
+        self.startup_stages_left = 2
+        # Missing files are looked for in the background, game id -> missing paths
+        self.path_checker = PathChecker()
+        self.broken_games = {}
+        # Emulators not picked yet are loaded on a background thread when the whole library is needed,
+        # functions waiting for that load run once it is in
+        self.loading_all = False
+        self.after_load_all = []
+        # The selected game's files are read ahead so a launch from a cold disk starts sooner
+        self.prefetcher = Prefetcher()
 
         panel = wx.Panel(self)
-        self.statusbar = self.CreateStatusBar(1)
+        self.panel = panel
+        # The second field shows the running games, the first is reset as the list changes
+        self.statusbar = self.CreateStatusBar(2)
+        self.statusbar.SetStatusWidths([-2, -1])
 
-        # Gets a list of the emulators and picks the first one
-        self.emulator_list = sorted(list(self.emu_dict.keys()))
-        if self.emulator_list:
-            self.emulator_name = self.emulator_list[0]
-        else:
-            self.emulator_name = ''
+        # The emulator list is filled in when the library has loaded
+        self.emulator_list = []
+        self.emulator_id = ''
 
         # Sets up variables used in the program
         self.emu_executable = ''
         self.game_lib = ''
         self.current_game_id = ''
+        self.keep_game_fields = False
         self.default_option = ''
         self.working_directory = ''
         self.filtered_game_list = []
-        self.game_index_dict = {}
 
         # UI Elements
-        self.my_list = wx.ListBox(panel, style=wx.LB_SINGLE)
+        self.search_ctrl = wx.SearchCtrl(panel)
+        self.search_ctrl.SetDescriptiveText("Search all games, notes and options")
+        self.search_ctrl.ShowCancelButton(True)
+        self.broken_only = wx.CheckBox(panel, label="Show only games with missing files")
+        self.my_list = GameListCtrl(panel, self.games_dict, self.data_manager.emulator_name)
+        self.my_list.broken = self.broken_games
         self.run_options = wx.TextCtrl(panel, style=wx.TE_MULTILINE)
         self.cwd = wx.TextCtrl(panel, style=wx.TE_READONLY)
         self.default_opt_ctrl = wx.TextCtrl(panel, style=wx.TE_READONLY)
@@ -103,16 +310,26 @@ class MyFrame(wx.Frame):
         play_btn.Bind(wx.EVT_BUTTON, self.on_run_game)
         update_btn.Bind(wx.EVT_BUTTON, self.on_update_game_details)
         exit_btn.Bind(wx.EVT_BUTTON, self.on_exit)
-        self.my_list.Bind(wx.EVT_LISTBOX_DCLICK, self.on_double_click)
-        self.my_list.Bind(wx.EVT_LISTBOX, self.on_list_select)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        self.my_list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_double_click)
+        self.my_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_list_select)
         self.choice_of_emu.Bind(wx.EVT_COMBOBOX, self.on_emulator_change)
+        self.search_ctrl.Bind(wx.EVT_TEXT, self.on_search)
+        self.search_ctrl.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self.on_search_cancel)
+        self.broken_only.Bind(wx.EVT_CHECKBOX, self.on_search)
+        self.path_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_path_timer, self.path_timer)
 
         # Layout
         main_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        left_sizer = wx.BoxSizer(wx.VERTICAL)
         right_sizer = wx.BoxSizer(wx.VERTICAL)
         button_sizer = wx.BoxSizer(wx.HORIZONTAL)
 
-        main_sizer.Add(self.my_list, 1, wx.EXPAND | wx.ALL, 5)
+        left_sizer.Add(self.search_ctrl, 0, wx.EXPAND | wx.BOTTOM, 5)
+        left_sizer.Add(self.broken_only, 0, wx.BOTTOM, 5)
+        left_sizer.Add(self.my_list, 1, wx.EXPAND)
+        main_sizer.Add(left_sizer, 1, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(right_sizer, 2, wx.EXPAND | wx.ALL, 5)
 
         right_sizer.Add(wx.StaticText(panel, label="Emulator Selected:"), 0, wx.ALL, 5)
@@ -139,18 +356,81 @@ class MyFrame(wx.Frame):
 
         panel.SetSizer(main_sizer)
 
-        # Initialize UI state
-        if self.emulator_name:
-            self.choice_of_emu.SetValue(self.emulator_name)
-        self.filter_the_games(False)
-
         self.make_menu_bar()
+        self.enable_controls(False)
+        self.statusbar.SetStatusText("Loading library...")
+        STARTUP_TIMES.append(('build window', time.perf_counter() - frame_started))
         self.Show()
+        wx.CallAfter(self.on_first_paint)
+        threading.Thread(target=self.load_library, name='RetroRoamingLoad', daemon=True).start()
+
+    @staticmethod
+    def show_error(message):
+        """Report an error from the data manager, which may be on a background thread."""
+        wx.CallAfter(wx.MessageBox, message, "Error", wx.OK | wx.ICON_ERROR)
+
+    def enable_controls(self, enabled):
+        """Enable or disable the panel and menus, they stay disabled while the library loads."""
+        self.panel.Enable(enabled)
+        menubar = self.GetMenuBar()
+        for pos in range(menubar.GetMenuCount()):
+            menubar.EnableTop(pos, enabled)
+
+    def load_library(self):
+        """Load the library on a background thread, then fill the list on the UI thread."""
+        # Only the first emulator's games are read now, the rest as each emulator is picked
+        self.data_manager.load(lambda message: wx.CallAfter(self.statusbar.SetStatusText, message), lazy=True)
+        wx.CallAfter(self.on_library_loaded)
+
+    def on_first_paint(self):
+        STARTUP_TIMES.append(('first paint at', time.perf_counter() - STARTUP_STARTED))
+        self.startup_finished()
+
+    def on_library_loaded(self):
+        """Initialize UI state once the library is in memory."""
+        filled = time.perf_counter()
+        # Gets a list of the emulators and picks the first one
+        self.emulator_list = sorted(details['Name'] for details in self.emu_dict.values())
+        self.emulator_id = self.data_manager.emulator_id(self.emulator_list[0]) if self.emulator_list else ''
+        self.choice_of_emu.SetItems(self.emulator_list)
+        if self.emulator_id:
+            self.choice_of_emu.SetValue(self.emulator_list[0])
+        self.filter_the_games(False)
+        self.enable_controls(True)
+        self.statusbar.SetStatusText(f"{len(self.games_dict)} games loaded")
+        STARTUP_TIMES.extend(self.data_manager.load_times)
+        STARTUP_TIMES.append(('fill list', time.perf_counter() - filled))
+        STARTUP_TIMES.append(('library ready at', time.perf_counter() - STARTUP_STARTED))
+        self.startup_finished()
+        # Pick up edits made by scripts or sync tools while the program is running
+        # The files are read on the watcher thread and the changes applied on this one
+        self.data_manager.watch(self._on_external_change, wx.CallAfter)
+        self.check_paths()
+        self.index_notes()
+        self.path_timer.Start(self.path_checker.ttl * 1000)
+
+    def startup_finished(self):
+        """Print the timing breakdown once both the window and the library are ready."""
+        self.startup_stages_left -= 1
+        if self.startup_stages_left == 0 and self.show_timings:
+            print("Startup timings (seconds):")
+            for stage, seconds in STARTUP_TIMES:
+                print(f"  {stage:<16}{seconds:8.3f}")
 
     def on_exit(self, event):
         """Close the frame, terminating the application."""
         self.Close(True)
 
+    def on_close(self, event):
+        """Write any unsaved changes before the frame goes."""
+        self.path_timer.Stop()
+        self.prefetcher.stop()
+        self.data_manager.close()
+        profile_file = self.profile.stop()
+        if profile_file:
+            print(f"Profile written to {profile_file}")
+        event.Skip()
+
     def make_menu_bar(self):
         """Build the menu bar and bind event handlers."""
         file_menu = wx.Menu()
@@ -166,6 +446,13 @@ class MyFrame(wx.Frame):
                                     "Allows you to changes details on the game in the library")
         delete_item = edit_menu.Append(-1, "&Delete Game\tCtrl-D",
                                       "Remove the game from you library")
+        edit_menu.AppendSeparator()
+        check_item = edit_menu.Append(-1, "&Check for Missing Files",
+                                     "Look again for every emulator, working directory and file the games use")
+        duplicates_item = edit_menu.Append(-1, "Find D&uplicate Games",
+                                          "Compare the contents of the game files to find copies of the same game")
+        test_item = edit_menu.Append(-1, "&Test Launch Games...",
+                                     "Start the games side by side and report the ones that fail to run")
 
         emu_menu = wx.Menu()
         add_emu_item = emu_menu.Append(-1, "&Add Emulator",
@@ -174,8 +461,19 @@ class MyFrame(wx.Frame):
                                           "Edit details of the emulator set up")
         delete_emu_item = emu_menu.Append(-1, "&Delete Emulator",
                                           "Remove the emulator - this will also remove the library of games")
+        emu_menu.AppendSeparator()
+        scan_item = emu_menu.Append(-1, "&Scan Libraries for Games",
+                                    "Import new game files found in each emulator's default games directory")
+        full_scan_item = emu_menu.Append(-1, "&Full Rescan of Libraries",
+                                         "Look at every file in the default games directories, not just new ones")
 
         help_menu = wx.Menu()
+        self.perf_item = help_menu.AppendCheckItem(-1, "&Record Performance Stats",
+                                                   "Time the event handlers and saves, see Help > Performance")
+        self.perf_item.Check(retro_perf.stats.enabled)
+        perf_dialog_item = help_menu.Append(-1, "&Performance...",
+                                            "Show call counts, latencies and bytes written")
+        help_menu.AppendSeparator()
         about_item = help_menu.Append(wx.ID_ABOUT)
 
         menubar = wx.MenuBar()
@@ -188,13 +486,20 @@ class MyFrame(wx.Frame):
 
         self.Bind(wx.EVT_MENU, self.on_exit, exit_item)
         self.Bind(wx.EVT_MENU, self.on_about, about_item)
+        self.Bind(wx.EVT_MENU, self.on_toggle_perf, self.perf_item)
+        self.Bind(wx.EVT_MENU, self.on_show_perf, perf_dialog_item)
         self.Bind(wx.EVT_MENU, self.on_file_open, file_open_item)
         self.Bind(wx.EVT_MENU, self.on_add_game, add_item)
         self.Bind(wx.EVT_MENU, self.on_edit_game_name, edit_item)
         self.Bind(wx.EVT_MENU, self.on_delete_game, delete_item)
+        self.Bind(wx.EVT_MENU, self.on_check_paths, check_item)
+        self.Bind(wx.EVT_MENU, self.on_find_duplicates, duplicates_item)
+        self.Bind(wx.EVT_MENU, self.on_test_launch, test_item)
         self.Bind(wx.EVT_MENU, self.on_add_emu, add_emu_item)
         self.Bind(wx.EVT_MENU, self.on_edit_emu, edit_emu_item)
         self.Bind(wx.EVT_MENU, self.on_delete_emu, delete_emu_item)
+        self.Bind(wx.EVT_MENU, self.on_scan_libraries, scan_item)
+        self.Bind(wx.EVT_MENU, lambda event: self.on_scan_libraries(event, full=True), full_scan_item)
 
     def on_about(self, event):
         """Display an About Dialog"""
@@ -204,8 +509,15 @@ class MyFrame(wx.Frame):
                       "About Retro Roaming",
                       wx.OK | wx.ICON_INFORMATION | wx.CENTER)
 
+    def on_toggle_perf(self, event):
+        retro_perf.stats.enabled = self.perf_item.IsChecked()
+
+    def on_show_perf(self, event):
+        """Show the live performance summary."""
+        PerformanceDialog(self).Show()
+
     def on_add_game(self, event):
-        if not self.emulator_name:
+        if not self.emulator_id:
             wx.MessageBox("You need to set up an emulator first.", "Warning", wx.OK | wx.ICON_STOP | wx.CENTER)
             return
 
@@ -218,20 +530,14 @@ class MyFrame(wx.Frame):
         with wx.TextEntryDialog(self, 'Name of the game?', 'Add a game') as name_dlg:
             if name_dlg.ShowModal() == wx.ID_OK:
                 game_name = name_dlg.GetValue()
-                if any(details['Game'] == game_name and details['Application'] == self.emulator_name 
-                       for details in self.games_dict.values()):
+                if self.data_manager.find_game(self.emulator_id, game_name) is not None:
                     wx.MessageBox(f"The game '{game_name}' is already setup for this emulator.", "Warning", wx.OK | wx.ICON_STOP | wx.CENTER)
                     return
 
-                new_id = str(uuid.uuid4())
-                self.games_dict[new_id] = {
-                    'Game': game_name,
-                    'Application': self.emulator_name,
-                    'Options': f' "{path}" {self.default_option}',
-                    'Notes': ''
-                }
-                self.current_game_id = new_id
+                self.current_game_id = self.data_manager.add_game(self.emulator_id, game_name,
+                                                                  f' "{path}" {self.default_option}')
                 self.filter_the_games(True)
+                self.check_paths([self.current_game_id])
 
     def on_edit_game_name(self, event):
         if not self.current_game_id or self.current_game_id not in self.games_dict:
@@ -242,7 +548,11 @@ class MyFrame(wx.Frame):
         with wx.TextEntryDialog(self, 'Change the name?', 'Edit a game', value=current_details['Game']) as dlg:
             if dlg.ShowModal() == wx.ID_OK:
                 new_name = dlg.GetValue()
-                self.games_dict[self.current_game_id]['Game'] = new_name
+                existing_id = self.data_manager.find_game(current_details['Emulator_id'], new_name)
+                if existing_id is not None and existing_id != self.current_game_id:
+                    wx.MessageBox(f"The game '{new_name}' is already setup for this emulator.", "Warning", wx.OK | wx.ICON_STOP | wx.CENTER)
+                    return
+                self.data_manager.rename_game(self.current_game_id, new_name)
                 self.filter_the_games(True)
 
     def on_delete_game(self, event):
@@ -253,7 +563,8 @@ class MyFrame(wx.Frame):
         msg = f"Do you really want to delete '{self.games_dict[self.current_game_id]['Game']}'?"
         with wx.MessageDialog(self, msg, 'Are you sure?', wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION) as dlg:
             if dlg.ShowModal() == wx.ID_YES:
-                del self.games_dict[self.current_game_id]
+                self.data_manager.delete_game(self.current_game_id)
+                self.broken_games.pop(self.current_game_id, None)
                 self.current_game_id = ''
                 self.filter_the_games(True)
 
@@ -262,7 +573,7 @@ class MyFrame(wx.Frame):
             if name_dlg.ShowModal() != wx.ID_OK:
                 return
             emu_name = name_dlg.GetValue()
-            if emu_name in self.emu_dict:
+            if self.data_manager.emulator_id(emu_name) is not None:
                 wx.MessageBox(f"The emulator '{emu_name}' is already setup", "Warning", wx.OK | wx.ICON_STOP | wx.CENTER)
                 return
 
@@ -279,87 +590,341 @@ class MyFrame(wx.Frame):
         with wx.TextEntryDialog(self, 'Any default options to add to new games?', 'Default Options') as opt_dlg:
             default_local = opt_dlg.GetValue() if opt_dlg.ShowModal() == wx.ID_OK else ""
 
-        self.emu_dict[emu_name] = {
+        with wx.TextEntryDialog(self, 'File extensions to import when scanning the library? (e.g. .tzx .tap)',
+                                'Scan Extensions') as ext_dlg:
+            extensions = ext_dlg.GetValue() if ext_dlg.ShowModal() == wx.ID_OK else ""
+
+        with wx.MessageDialog(self, SHELL_LAUNCH_QUESTION, 'Launch Method', wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION) as shell_dlg:
+            use_shell = shell_dlg.ShowModal() == wx.ID_YES
+
+        emu_id = self.data_manager.add_emulator(emu_name, {
             'Location': f'"{exe_path}"',
             'Library_default': path2,
             'Default_option': default_local,
-            'Working_Directory': working_dir
-        }
-        self.emulator_list = sorted(list(self.emu_dict.keys()))
+            'Working_Directory': working_dir,
+            'Scan_extensions': extensions,
+            'Use_shell': use_shell
+        })
+        self.emulator_list = sorted(details['Name'] for details in self.emu_dict.values())
         self.choice_of_emu.SetItems(self.emulator_list)
         self.choice_of_emu.SetStringSelection(emu_name)
-        self.emulator_name = emu_name
+        self.emulator_id = emu_id
         self.filter_the_games(True)
 
     def on_edit_emu(self, event):
-        if not self.emulator_name:
+        if not self.emulator_id:
             return
 
-        with wx.TextEntryDialog(self, 'Change the name of the emulator?', 'Edit emulator', value=self.emulator_name) as name_dlg:
+        emu_data = self.emu_dict[self.emulator_id]
+        with wx.TextEntryDialog(self, 'Change the name of the emulator?', 'Edit emulator', value=emu_data['Name']) as name_dlg:
             if name_dlg.ShowModal() != wx.ID_OK:
                 return
             new_emu_name = name_dlg.GetValue()
+            existing_id = self.data_manager.emulator_id(new_emu_name)
+            if existing_id is not None and existing_id != self.emulator_id:
+                wx.MessageBox(f"The emulator '{new_emu_name}' is already setup", "Warning", wx.OK | wx.ICON_STOP | wx.CENTER)
+                return
 
-        current_exe = self.emu_dict[self.emulator_name]["Location"].strip('"')
+        current_exe = emu_data["Location"].strip('"')
         with wx.FileDialog(self, "Select the emulator's executable", defaultFile=current_exe) as exe_dlg:
             if exe_dlg.ShowModal() == wx.ID_OK:
                 exe_path = exe_dlg.GetPath()
                 working_dir = exe_dlg.GetDirectory()
             else:
                 exe_path = current_exe
-                working_dir = self.emu_dict[self.emulator_name]['Working_Directory']
+                working_dir = emu_data['Working_Directory']
 
-        current_lib = self.emu_dict[self.emulator_name]['Library_default']
+        current_lib = emu_data['Library_default']
         with wx.DirDialog(self, "Select the emulator's default games directory", defaultPath=current_lib) as dir_dlg:
             lib_path = dir_dlg.GetPath() if dir_dlg.ShowModal() == wx.ID_OK else current_lib
 
-        current_opt = self.emu_dict[self.emulator_name]['Default_option']
+        current_opt = emu_data['Default_option']
         with wx.TextEntryDialog(self, 'Default options?', 'Edit Options', value=current_opt) as opt_dlg:
             opt_val = opt_dlg.GetValue() if opt_dlg.ShowModal() == wx.ID_OK else current_opt
 
-        # Update all games associated with this emulator if name changed
-        if new_emu_name != self.emulator_name:
-            for game_id in self.games_dict:
-                if self.games_dict[game_id]['Application'] == self.emulator_name:
-                    self.games_dict[game_id]['Application'] = new_emu_name
-            self.emu_dict[new_emu_name] = self.emu_dict.pop(self.emulator_name)
-
-        self.emu_dict[new_emu_name].update({
-            'Location': f'"{exe_path}"',
-            'Library_default': lib_path,
-            'Default_option': opt_val,
-            'Working_Directory': working_dir
-        })
+        current_ext = emu_data.get('Scan_extensions', '')
+        with wx.TextEntryDialog(self, 'File extensions to import when scanning the library? (e.g. .tzx .tap)',
+                                'Scan Extensions', value=current_ext) as ext_dlg:
+            ext_val = ext_dlg.GetValue() if ext_dlg.ShowModal() == wx.ID_OK else current_ext
+
+        current_shell = emu_data.get('Use_shell', False)
+        with wx.MessageDialog(self, SHELL_LAUNCH_QUESTION, 'Launch Method',
+                              wx.YES_NO | (wx.YES_DEFAULT if current_shell else wx.NO_DEFAULT) | wx.ICON_QUESTION) as shell_dlg:
+            use_shell = shell_dlg.ShowModal() == wx.ID_YES
+
+        # Games refer to the emulator by id so a new name only changes the emulator record
+        self.data_manager.update_emulator(self.emulator_id,
+                                          Name=new_emu_name,
+                                          Location=f'"{exe_path}"',
+                                          Library_default=lib_path,
+                                          Default_option=opt_val,
+                                          Working_Directory=working_dir,
+                                          Scan_extensions=ext_val,
+                                          Use_shell=use_shell)
         
-        self.emulator_list = sorted(list(self.emu_dict.keys()))
+        self.emulator_list = sorted(details['Name'] for details in self.emu_dict.values())
         self.choice_of_emu.SetItems(self.emulator_list)
         self.choice_of_emu.SetStringSelection(new_emu_name)
-        self.emulator_name = new_emu_name
         self.filter_the_games(True)
+        self.check_paths(self.data_manager.games_for_emulator(self.emulator_id))
 
     def on_delete_emu(self, event):
-        if not self.emulator_name:
+        if not self.emulator_id:
             return
 
-        msg = f"Delete '{self.emulator_name}' and ALL its games?"
+        msg = f"Delete '{self.data_manager.emulator_name(self.emulator_id)}' and ALL its games?"
         with wx.MessageDialog(self, msg, 'Are you sure?', wx.YES_NO | wx.NO_DEFAULT | wx.ICON_STOP) as dlg:
             if dlg.ShowModal() == wx.ID_YES:
-                # Remove games
-                games_to_del = [gid for gid, details in self.games_dict.items() if details['Application'] == self.emulator_name]
-                for gid in games_to_del:
-                    del self.games_dict[gid]
-                
-                del self.emu_dict[self.emulator_name]
-                self.emulator_list = sorted(list(self.emu_dict.keys()))
+                # Remove the emulator along with its games
+                self.data_manager.delete_emulator(self.emulator_id)
+                self.emulator_list = sorted(details['Name'] for details in self.emu_dict.values())
                 self.choice_of_emu.SetItems(self.emulator_list)
                 if self.emulator_list:
-                    self.emulator_name = self.emulator_list[0]
-                    self.choice_of_emu.SetStringSelection(self.emulator_name)
+                    self.emulator_id = self.data_manager.emulator_id(self.emulator_list[0])
+                    self.choice_of_emu.SetStringSelection(self.emulator_list[0])
                 else:
-                    self.emulator_name = ""
+                    self.emulator_id = ""
                     self.choice_of_emu.SetValue("")
                 self.filter_the_games(True)
 
+    def on_scan_libraries(self, event, full=False):
+        """Import new game files found under each emulator's default games directory, full looks at every file."""
+        emu_dict = {emu_id: details for emu_id, details in self.emu_dict.items()
+                    if LibraryScanner.extensions_for(details) and details.get('Library_default')}
+        if not emu_dict:
+            wx.MessageBox("Set a default games directory and the file extensions to import on an emulator first.",
+                          "Warning", wx.OK | wx.ICON_STOP | wx.CENTER)
+            return
+
+        scanner = LibraryScanner(os.path.join(self.data_manager.datastorelocation, 'scan_cache.json'))
+        cancel = threading.Event()
+        progress_dlg = wx.ProgressDialog("Scanning libraries", "Looking for games...", parent=self,
+                                         style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+        last_report = [0.0]
+
+        def report(done, found):
+            # Keep the UI event queue from flooding on large trees
+            now = time.monotonic()
+            if now - last_report[0] >= 0.1:
+                last_report[0] = now
+                wx.CallAfter(self._on_scan_progress, progress_dlg, cancel, done, found)
+
+        def run():
+            found = scanner.scan(emu_dict, report, cancel, full)
+            wx.CallAfter(self._on_scan_finished, progress_dlg, scanner, cancel, found)
+
+        threading.Thread(target=run, name='RetroRoamingScan', daemon=True).start()
+
+    def _on_scan_progress(self, progress_dlg, cancel, done, found):
+        if cancel.is_set() or not progress_dlg:
+            return
+        keep_going, _skip = progress_dlg.Pulse(f"{done} folders checked, {found} new files found")
+        if not keep_going:
+            cancel.set()
+
+    def _on_scan_finished(self, progress_dlg, scanner, cancel, found):
+        progress_dlg.Destroy()
+        if cancel.is_set():
+            self.statusbar.SetStatusText("Library scan cancelled")
+            return
+        added = self.data_manager.import_games(found)
+        scanner.save_cache()
+        self.filter_the_games(False)
+        self.check_paths()
+        wx.MessageBox(f"{added} new games added to the library.", "Scan complete", wx.OK | wx.ICON_INFORMATION)
+
+    def check_paths(self, game_ids=None):
+        """Look for missing files on a background thread, None checks every game."""
+        with self.data_manager.lock:
+            if game_ids is None:
+                games = dict(self.games_dict)
+            else:
+                games = {game_id: self.games_dict[game_id] for game_id in game_ids if game_id in self.games_dict}
+            emu_dict = dict(self.emu_dict)
+
+        def run():
+            broken = self.path_checker.check(games, emu_dict)
+            wx.CallAfter(self._on_paths_checked, games.keys(), broken)
+
+        threading.Thread(target=run, name='RetroRoamingPathCheck', daemon=True).start()
+
+    def _on_paths_checked(self, checked_ids, broken):
+        for game_id in checked_ids:
+            self.broken_games.pop(game_id, None)
+        self.broken_games.update(broken)
+        if self.broken_only.GetValue():
+            self.refresh_game_list()
+        else:
+            self.my_list.Refresh()
+        if broken and len(checked_ids) > 1:
+            self.statusbar.SetStatusText(f"{len(self.broken_games)} games have missing files")
+
+    def on_path_timer(self, event):
+        """Look again at every game's files, the cache only saves stats between these checks."""
+        self.path_checker.clear()
+        self.check_paths()
+
+    def on_check_paths(self, event):
+        """Check every game again, ignoring earlier results."""
+        self.path_checker.clear()
+        self.check_paths()
+        # Games of emulators not loaded yet are checked as they arrive
+        self.load_all_emulators()
+
+    def load_all_emulators(self, then=None):
+        """Load the games of the emulators not picked yet on a background thread, for work across the library.
+
+        then() is called on the UI thread once every emulator's games are in, straight away if they already are.
+        """
+        if self.data_manager.all_loaded():
+            if then is not None:
+                then()
+            return
+        if then is not None and then not in self.after_load_all:
+            self.after_load_all.append(then)
+        if self.loading_all:
+            return
+        self.loading_all = True
+        self.statusbar.SetStatusText("Loading the rest of the library...")
+        emu_ids = self.data_manager.unloaded_emulators()
+
+        def run():
+            shards = self.data_manager.read_emulators(emu_ids)
+            wx.CallAfter(self._on_all_loaded, shards)
+
+        threading.Thread(target=run, name='RetroRoamingLoadAll', daemon=True).start()
+
+    def _on_all_loaded(self, shards):
+        # The records are added here on the UI thread, which is the only one reading them without the lock
+        added = self.data_manager.add_emulators(shards)
+        self.loading_all = False
+        self.statusbar.SetStatusText(f"{len(self.games_dict)} games loaded")
+        self.check_paths(added)
+        self.index_notes(added)
+        if not self.data_manager.all_loaded():
+            # Emulators added by another program meanwhile
+            self.load_all_emulators()
+            return
+        waiting, self.after_load_all = self.after_load_all, []
+        for then in waiting:
+            then()
+
+    def index_notes(self, game_ids=None):
+        """Read the games' notes into the search index on a background thread, None does every game."""
+        threading.Thread(target=self.data_manager.index_notes, args=(game_ids,),
+                         name='RetroRoamingNotesIndex', daemon=True).start()
+
+    def on_find_duplicates(self, event):
+        """Hash the game files in the background and list the games sharing the same contents."""
+        self.load_all_emulators(self.find_duplicates)
+
+    def find_duplicates(self):
+        with self.data_manager.lock:
+            games = dict(self.games_dict)
+            emu_dict = dict(self.emu_dict)
+        hasher = ContentHasher(os.path.join(self.data_manager.datastorelocation, 'hash_cache.json'))
+        cancel = threading.Event()
+        progress_dlg = wx.ProgressDialog("Finding duplicates", "Reading game files...", parent=self,
+                                         style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+        last_report = [0.0]
+
+        def report(done, total):
+            now = time.monotonic()
+            if now - last_report[0] >= 0.1:
+                last_report[0] = now
+                wx.CallAfter(self._on_hash_progress, progress_dlg, cancel, done, total)
+
+        def run():
+            groups = hasher.duplicates(games, emu_dict, report, cancel)
+            hasher.save_cache()
+            wx.CallAfter(self._on_duplicates_found, progress_dlg, cancel, groups)
+
+        threading.Thread(target=run, name='RetroRoamingHash', daemon=True).start()
+
+    def _on_hash_progress(self, progress_dlg, cancel, done, total):
+        if cancel.is_set() or not progress_dlg:
+            return
+        keep_going, _skip = progress_dlg.Update(done * 100 // max(total, 1), f"{done} of {total} files read")
+        if not keep_going:
+            cancel.set()
+
+    def _on_duplicates_found(self, progress_dlg, cancel, groups):
+        progress_dlg.Destroy()
+        if cancel.is_set() or groups is None:
+            self.statusbar.SetStatusText("Duplicate search cancelled")
+            return
+        if not groups:
+            wx.MessageBox("No two games use files with the same contents.", "Duplicate Games",
+                          wx.OK | wx.ICON_INFORMATION)
+            return
+        DuplicatesDialog(self, groups, self.games_dict, self.data_manager.emulator_name, self.show_game).Show()
+
+    def on_test_launch(self, event):
+        """Start the games in the background with a time limit, then report and mark the ones that failed."""
+        settings = LaunchTestSettingsDialog(self, len(self.filtered_game_list))
+        if settings.ShowModal() != wx.ID_OK:
+            settings.Destroy()
+            return
+        tester = LaunchTester(settings.timeout.GetValue(), settings.workers.GetValue())
+        every_game = settings.scope.GetSelection() == 1
+        settings.Destroy()
+        if every_game:
+            self.load_all_emulators(lambda: self.test_games(tester, list(self.games_dict)))
+        else:
+            self.test_games(tester, self.filtered_game_list)
+
+    def test_games(self, tester, game_ids):
+        with self.data_manager.lock:
+            games = {game_id: self.games_dict[game_id] for game_id in game_ids if game_id in self.games_dict}
+            emu_dict = dict(self.emu_dict)
+        if not games:
+            wx.MessageBox("There are no games to test.", "Test Launch Games", wx.OK | wx.ICON_INFORMATION)
+            return
+        cancel = threading.Event()
+        progress_dlg = wx.ProgressDialog("Testing games", f"Starting {len(games)} games...", parent=self,
+                                         style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+
+        def report(done, total):
+            wx.CallAfter(self._on_test_progress, progress_dlg, cancel, done, total)
+
+        def run():
+            results = tester.run(games, emu_dict, report, cancel)
+            wx.CallAfter(self._on_tests_finished, progress_dlg, cancel, results)
+
+        threading.Thread(target=run, name='RetroRoamingLaunchTest', daemon=True).start()
+
+    def _on_test_progress(self, progress_dlg, cancel, done, total):
+        if cancel.is_set() or not progress_dlg:
+            return
+        keep_going, _skip = progress_dlg.Update(done * 100 // max(total, 1), f"{done} of {total} games tested")
+        if not keep_going:
+            cancel.set()
+
+    def _on_tests_finished(self, progress_dlg, cancel, results):
+        progress_dlg.Destroy()
+        if cancel.is_set() or results is None:
+            self.statusbar.SetStatusText("Launch test cancelled")
+            return
+        self.data_manager.record_tests(results)
+        self.my_list.Refresh()
+        failed = sum(not passed for passed, _result in results.values())
+        self.statusbar.SetStatusText(f"{failed} of {len(results)} games failed to launch")
+        LaunchTestDialog(self, results, self.games_dict, self.data_manager.emulator_name, self.show_game).Show()
+
+    def show_game(self, game_id):
+        """Switch to a game's emulator and select the game."""
+        if game_id not in self.games_dict:
+            return
+        emu_id = self.games_dict[game_id]['Emulator_id']
+        if emu_id not in self.emu_dict:
+            return
+        self.search_ctrl.ChangeValue('')
+        self.broken_only.SetValue(False)
+        self.emulator_id = emu_id
+        self.choice_of_emu.SetStringSelection(self.emu_dict[emu_id]['Name'])
+        self.current_game_id = game_id
+        self.filter_the_games(False)
+
     def on_file_open(self, event):
         """Add a file path to the current game's options"""
         if not self.current_game_id or self.current_game_id not in self.games_dict:
@@ -371,40 +936,43 @@ class MyFrame(wx.Frame):
             if dlg.ShowModal() == wx.ID_OK:
                 path = dlg.GetPath()
                 current_options = self.games_dict[self.current_game_id]["Options"]
-                self.games_dict[self.current_game_id]["Options"] = f'{current_options} "{path}"'
+                self.data_manager.update_game(self.current_game_id, Options=f'{current_options} "{path}"')
                 self.on_list_select(None)
+                self.check_paths([self.current_game_id])
 
+    @timed('on_run_game')
     def on_run_game(self, event):
         emu_path = self.emu_location.GetValue()
         if not emu_path:
             wx.MessageBox("No emulator executable selected.", "Error", wx.OK | wx.ICON_ERROR)
             return
 
-        # Ensure emu_path is quoted if it contains spaces and is not already quoted
-        # We strip quotes first to avoid double quoting if it was somehow already quoted
-        emu_path = emu_path.strip('"')
-        if ' ' in emu_path:
-            emu_path = f'"{emu_path}"'
-
         if len(self.filtered_game_list) > 0:
-            select_index = self.my_list.GetSelection()
-            if select_index == wx.NOT_FOUND:
+            selected_id = self.my_list.selected_game_id()
+            if not selected_id:
                 wx.MessageBox("Please select a game to play.", "Info", wx.OK | wx.ICON_INFORMATION)
                 return
 
-            game_name = self.filtered_game_list[select_index]
-            self.current_game_id = self.game_index_dict[game_name]
-            options = self.games_dict[self.current_game_id]["Options"]
-            
-            # Construct the command correctly for Windows.
-            # We must not wrap the entire command in an extra set of quotes as it causes
-            # cmd.exe to fail parsing quoted paths correctly.
-            cmd = f'{emu_path} {options}'
-            
+            self.current_game_id = selected_id
+            details = self.games_dict[self.current_game_id]
+            if details['Emulator_id'] != self.emulator_id:
+                # Never run a game with whichever emulator happens to be showing
+                wx.MessageBox(f"'{details['Game']}' doesn't belong to the emulator selected.", "Error",
+                              wx.OK | wx.ICON_ERROR)
+                return
+            retro_perf.stats.count('prefetch hits' if self.prefetcher.was_prefetched(self.current_game_id)
+                                   else 'prefetch misses')
+            if self.launch_manager.is_running(self.current_game_id):
+                wx.MessageBox(f"'{details['Game']}' is already running.", "Info", wx.OK | wx.ICON_INFORMATION)
+                return
+
+            use_shell = self.emu_dict[self.emulator_id].get('Use_shell', False)
             try:
-                subprocess.Popen(cmd, cwd=self.working_directory, shell=True)
+                self.launch_manager.launch(self.current_game_id, emu_path, details["Options"],
+                                           self.working_directory, use_shell)
             except Exception as e:
                 wx.MessageBox(f"Failed to start game: {e}", "Error", wx.OK | wx.ICON_ERROR)
+            self.show_running_games()
         else:
             wx.MessageBox("The emulator hasn't got any games set up",
                           "Warning",
@@ -413,96 +981,204 @@ class MyFrame(wx.Frame):
     def on_double_click(self, event):
         self.on_run_game(None)
 
+    def on_game_finished(self, game_id, started, duration, exit_code):
+        """Called from the launch manager's wait thread when a game exits."""
+        wx.CallAfter(self._record_game_finished, game_id, started, duration, exit_code)
+
+    def _record_game_finished(self, game_id, started, duration, exit_code):
+        self.data_manager.record_play(game_id, started, duration, exit_code)
+        self.my_list.Refresh()
+        game_name = self.games_dict.get(game_id, {}).get('Game', 'Game')
+        if exit_code != 0:
+            self.show_running_games(f"{game_name} exited with code {exit_code}")
+        else:
+            self.show_running_games(f"{game_name} played for {round(duration / 60)} minutes")
+
+    def show_running_games(self, message=''):
+        """Show the games that are running in their own status bar field, and any message in the first."""
+        names = [self.games_dict[game_id]['Game'] for game_id in self.launch_manager.running_games()
+                 if game_id in self.games_dict]
+        if message:
+            self.statusbar.SetStatusText(message)
+        self.statusbar.SetStatusText(f"Running: {', '.join(names)}" if names else '', 1)
+
+    @timed('on_list_select')
     def on_list_select(self, event):
         """Update the UI based on the selected game."""
-        select_index = self.my_list.GetSelection()
-        if select_index == wx.NOT_FOUND:
+        selected_id = self.my_list.selected_game_id()
+        if not selected_id:
+            return
+        if self.keep_game_fields and selected_id == self.current_game_id:
             return
 
-        game_name = self.filtered_game_list[select_index]
-        self.current_game_id = self.game_index_dict[game_name]
+        self.current_game_id = selected_id
+
+        # Search results can come from any emulator, switch to the one the game belongs to
+        game_emu = self.games_dict[self.current_game_id]['Emulator_id']
+        if game_emu != self.emulator_id and game_emu in self.emu_dict:
+            self.emulator_id = game_emu
+            self.choice_of_emu.SetStringSelection(self.emu_dict[game_emu]['Name'])
+            self.show_emulator_details()
 
         # update items related to what has been selected
         self.run_options.SetValue(self.games_dict[self.current_game_id]['Options'])
-        self.game_notes.SetValue(self.games_dict[self.current_game_id]['Notes'])
+        self.game_notes.SetValue(self.data_manager.notes(self.current_game_id))
         
         # Display correctly quoted string for CMD
-        emu_path = self.emu_executable.strip('"')
-        if ' ' in emu_path:
-            emu_path = f'"{emu_path}"'
-        self.cmd_string.SetValue(f"{emu_path} {self.games_dict[self.current_game_id]['Options']}")
+        self.cmd_string.SetValue(build_command(self.emu_executable, self.games_dict[self.current_game_id]['Options']))
+
+        emu_data = self.emu_dict.get(game_emu, {})
+        self.prefetcher.request(self.current_game_id,
+                                [emu_data.get('Location', '').strip('"')] +
+                                PathChecker.option_paths(self.games_dict[self.current_game_id], emu_data))
 
+        missing = self.broken_games.get(self.current_game_id)
+        if missing:
+            self.statusbar.SetStatusText(f"Missing: {', '.join(missing)}")
+
+    @timed('on_emulator_change')
     def on_emulator_change(self, event):
-        self.emulator_name = self.choice_of_emu.GetStringSelection()
+        self.emulator_id = self.data_manager.emulator_id(self.choice_of_emu.GetStringSelection()) or ''
+        added = self.data_manager.load_emulator(self.emulator_id) if self.emulator_id else []
+        if added:
+            self.check_paths(added)
+            self.index_notes(added)
+        # Picking an emulator goes back to browsing its games
+        self.search_ctrl.ChangeValue('')
+        self.broken_only.SetValue(False)
         self.filter_the_games(False)
 
+    @timed('on_search')
+    def on_search(self, event):
+        """Filter the list as the search text changes."""
+        self.filter_the_games(False)
+        # Searches and the missing files filter cover every emulator, the results
+        # are shown again once the emulators not loaded yet are in
+        if self.search_ctrl.GetValue().strip() or self.broken_only.GetValue():
+            self.load_all_emulators(self.refresh_search)
+
+    def refresh_search(self):
+        if self.search_ctrl.GetValue().strip() or self.broken_only.GetValue():
+            self.filter_the_games(False)
+
+    def on_search_cancel(self, event):
+        self.search_ctrl.SetValue('')
+
+    def show_emulator_details(self):
+        """Fill the emulator fields from the selected emulator."""
+        emu_data = self.emu_dict[self.emulator_id]
+        # Store raw path in the UI control for display and execution
+        raw_emu_path = emu_data['Location'].strip('"')
+        self.emu_location.SetValue(raw_emu_path)
+        self.emu_executable = raw_emu_path
+        self.game_location.SetValue(emu_data['Library_default'])
+        self.game_lib = emu_data['Library_default']
+        self.default_opt_ctrl.SetValue(emu_data['Default_option'])
+        self.default_option = emu_data['Default_option']
+        self.cwd.SetValue(emu_data['Working_Directory'])
+        self.working_directory = emu_data['Working_Directory']
+
+    @timed('filter_the_games')
     def filter_the_games(self, save_data):
-        """Filter the games list based on the selected emulator."""
+        """Filter the games list based on the search text or else the selected emulator."""
         if self.emulator_list:
             if save_data:
                 self.data_manager.save_data()
 
-            if self.emulator_name not in self.emu_dict:
-                self.emulator_name = self.emulator_list[0] if self.emulator_list else ""
-
-            if self.emulator_name:
-                emu_data = self.emu_dict[self.emulator_name]
-                # Store raw path in the UI control for display and execution
-                raw_emu_path = emu_data['Location'].strip('"')
-                self.emu_location.SetValue(raw_emu_path)
-                self.emu_executable = raw_emu_path
-                self.game_location.SetValue(emu_data['Library_default'])
-                self.game_lib = emu_data['Library_default']
-                self.default_opt_ctrl.SetValue(emu_data['Default_option'])
-                self.default_option = emu_data['Default_option']
-                self.cwd.SetValue(emu_data['Working_Directory'])
-                self.working_directory = emu_data['Working_Directory']
+            if self.emulator_id not in self.emu_dict:
+                self.emulator_id = self.data_manager.emulator_id(self.emulator_list[0]) or ""
+
+            if self.emulator_id:
+                self.show_emulator_details()
         else:
             self.emu_location.SetValue('')
             self.game_location.SetValue('')
             self.cmd_string.SetValue('')
 
-        self.filtered_game_list = []
-        self.game_index_dict = {}
-        for game_id, details in self.games_dict.items():
-            if details['Application'] == self.emulator_name:
-                game_name = details['Game']
-                self.filtered_game_list.append(game_name)
-                self.game_index_dict[game_name] = game_id
-        self.filtered_game_list.sort()
-
-        self.my_list.Set(self.filtered_game_list)
+        self.fill_game_list()
 
         if self.filtered_game_list:
             # Try to maintain selection or pick first
-            current_game_name = self.games_dict.get(self.current_game_id, {}).get('Game', '')
-            if current_game_name in self.filtered_game_list:
-                current_selection = self.filtered_game_list.index(current_game_name)
-            else:
-                current_selection = 0
-            
-            self.my_list.SetSelection(current_selection)
+            if not self.my_list.select_game(self.current_game_id):
+                self.my_list.select_game(self.filtered_game_list[0])
             self.on_list_select(None)
         else:
             self.run_options.SetValue('')
             self.game_notes.SetValue('')
             self.cmd_string.SetValue('')
 
+    def fill_game_list(self):
+        """Show the games matching the search text, or else the selected emulator's games."""
+        # The list holds game ids so games sharing a name stay separate
+        query = self.search_ctrl.GetValue().strip()
+        broken_only = self.broken_only.GetValue()
+        if query:
+            game_ids = self.data_manager.search(query)
+            if broken_only:
+                game_ids &= self.broken_games.keys()
+            self.my_list.set_games(self.with_emulator(game_ids))
+            self.statusbar.SetStatusText(f"{len(self.my_list.game_ids)} games match '{query}'")
+        elif broken_only:
+            # Games with missing files from every emulator, for fixing in bulk
+            self.my_list.set_games(self.with_emulator(self.broken_games.keys() & self.games_dict.keys()))
+            self.statusbar.SetStatusText(f"{len(self.my_list.game_ids)} games have missing files")
+        else:
+            self.my_list.set_games(self.data_manager.games_for_emulator(self.emulator_id))
+            self.statusbar.SetStatusText('')
+        self.filtered_game_list = self.my_list.game_ids
+
+    def refresh_game_list(self):
+        """Fill the list again keeping the selected game's fields, they may hold unsaved typing."""
+        self.fill_game_list()
+        self.keep_game_fields = True
+        try:
+            still_listed = self.my_list.select_game(self.current_game_id)
+        finally:
+            self.keep_game_fields = False
+        if not still_listed:
+            self.filter_the_games(False)
+
+    def with_emulator(self, game_ids):
+        """Leave out games whose emulator has gone, they couldn't be run or shown with their emulator."""
+        return {game_id for game_id in game_ids if self.games_dict[game_id]['Emulator_id'] in self.emu_dict}
+
+    def _on_external_change(self, emu_ids, game_ids, conflicts):
+        """Show records another program changed without resetting the window."""
+        if emu_ids:
+            self.emulator_list = sorted(details['Name'] for details in self.emu_dict.values())
+            self.choice_of_emu.SetItems(self.emulator_list)
+        if self.emulator_id not in self.emu_dict or self.current_game_id in game_ids:
+            # What is on show was changed, refresh it all
+            self.filter_the_games(False)
+        else:
+            if self.emulator_id in emu_ids:
+                self.show_emulator_details()
+            self.refresh_game_list()
+        if emu_ids and self.emulator_id in self.emu_dict:
+            self.choice_of_emu.SetStringSelection(self.emu_dict[self.emulator_id]['Name'])
+        self.statusbar.SetStatusText(f"Reloaded {len(game_ids)} games and {len(emu_ids)} emulators "
+                                     f"changed outside Retro Roaming")
+        self.check_paths(game_ids & self.games_dict.keys())
+        if conflicts:
+            wx.MessageBox(f"{len(conflicts)} records were changed outside Retro Roaming while you had "
+                          "unsaved changes to them.\n\nYour changes have been kept and will be saved over "
+                          "the outside ones.", "Library Changed", wx.OK | wx.ICON_WARNING)
+
+    @timed('on_update_game_details')
     def on_update_game_details(self, event):
         """Update current game options and notes."""
         if self.filtered_game_list:
             if self.current_game_id not in self.games_dict:
                 return
             
-            self.games_dict[self.current_game_id]["Options"] = self.run_options.GetValue()
-            self.games_dict[self.current_game_id]["Notes"] = self.game_notes.GetValue()
+            self.data_manager.update_game(self.current_game_id,
+                                          Options=self.run_options.GetValue(),
+                                          Notes=self.game_notes.GetValue())
             
             # Display correctly quoted string for CMD
-            emu_path = self.emu_executable.strip('"')
-            if ' ' in emu_path:
-                emu_path = f'"{emu_path}"'
-            self.cmd_string.SetValue(f"{emu_path} {self.games_dict[self.current_game_id]['Options']}")
+            self.cmd_string.SetValue(build_command(self.emu_executable, self.games_dict[self.current_game_id]['Options']))
             self.data_manager.save_data()
+            self.check_paths([self.current_game_id])
             
             game_name = self.games_dict[self.current_game_id]["Game"]
             wx.MessageBox(f'Details updated for {game_name}', 'Done', wx.OK | wx.ICON_INFORMATION)
@@ -511,7 +1187,8 @@ class MyFrame(wx.Frame):
 
 def main():
     app = wx.App()
-    MyFrame()
+    # --timings prints how long each startup stage took
+    MyFrame(show_timings='--timings' in sys.argv[1:])
     app.MainLoop()
 
 
@@ -0,0 +1,357 @@
+#
+# Retro Roaming command line - batch operations on the library without starting the window.
+# Run "python retro_cli.py --help" for the list of commands.
+#
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import retro_perf
+from retro_core import (ContentHasher, DataManager, LaunchManager, LaunchTester, LibraryScanner, PathChecker,
+                        default_data_location)
+
+EXPORT_FIELDS = ['Id', 'Game', 'Application', 'Options', 'Notes']
+
+
+def emulator_arg(data_manager, emu_name):
+    """Return the id of an emulator given by name on the command line."""
+    emu_id = data_manager.emulator_id(emu_name)
+    if emu_id is None:
+        raise SystemExit(f"Unknown emulator: {emu_name}")
+    return emu_id
+
+
+def select_games(data_manager, args):
+    """Return the game ids picked by the ids, --emulator and --search arguments."""
+    game_ids = getattr(args, 'ids', None) or []
+    missing = [game_id for game_id in game_ids if game_id not in data_manager.games_dict]
+    if missing:
+        raise SystemExit(f"Unknown game id: {', '.join(missing)}")
+    if game_ids:
+        return list(game_ids)
+    emu_id = emulator_arg(data_manager, args.emulator) if args.emulator else None
+    if getattr(args, 'search', None):
+        data_manager.index_notes()
+        selected = data_manager.search(args.search)
+        if emu_id:
+            selected &= data_manager.games_for_emulator(emu_id)
+    elif emu_id:
+        selected = data_manager.games_for_emulator(emu_id)
+    else:
+        selected = data_manager.games_dict.keys()
+    games_dict = data_manager.games_dict
+    return sorted(selected, key=lambda game_id: (data_manager.emulator_name(games_dict[game_id]['Emulator_id']),
+                                                 games_dict[game_id]['Game']))
+
+
+def cmd_emulators(data_manager, args):
+    for emu_id, details in sorted(data_manager.emu_dict.items(), key=lambda item: item[1]['Name']):
+        print(f"{details['Name']}\t{len(data_manager.games_for_emulator(emu_id))}\t{details['Location']}")
+
+
+def cmd_list(data_manager, args):
+    for game_id in select_games(data_manager, args):
+        details = data_manager.games_dict[game_id]
+        print(f"{game_id}\t{data_manager.emulator_name(details['Emulator_id'])}\t{details['Game']}")
+
+
+def cmd_add(data_manager, args):
+    emu_id = emulator_arg(data_manager, args.emulator)
+    if data_manager.find_game(emu_id, args.name) is not None:
+        raise SystemExit(f"The game '{args.name}' is already setup for this emulator.")
+    options = args.options
+    if args.file:
+        # Same as adding a game in the window, the file followed by the default option
+        options = f' "{args.file}" {data_manager.emu_dict[emu_id]["Default_option"]} {options}'.rstrip()
+    game_id = data_manager.add_game(emu_id, args.name, options, args.notes)
+    data_manager.save_data()
+    print(game_id)
+
+
+def require_selection(args):
+    """Stop edit and delete from touching the whole library by accident."""
+    if not (args.ids or args.emulator or args.search):
+        raise SystemExit("Give game ids, --emulator or --search to pick the games")
+
+
+def cmd_edit(data_manager, args):
+    require_selection(args)
+    game_ids = select_games(data_manager, args)
+    if args.name is not None and len(game_ids) != 1:
+        raise SystemExit("--name can only be used on a single game")
+    if args.name is not None:
+        # Same check as renaming in the window, names are unique within an emulator
+        existing_id = data_manager.find_game(data_manager.games_dict[game_ids[0]]['Emulator_id'], args.name)
+        if existing_id is not None and existing_id != game_ids[0]:
+            raise SystemExit(f"The game '{args.name}' is already setup for this emulator.")
+    for game_id in game_ids:
+        details = data_manager.games_dict[game_id]
+        fields = {}
+        if args.options is not None:
+            fields['Options'] = args.options
+        if args.replace_options:
+            old, new = args.replace_options
+            fields['Options'] = fields.get('Options', details['Options']).replace(old, new)
+        if args.notes is not None:
+            fields['Notes'] = args.notes
+        if fields:
+            data_manager.update_game(game_id, **fields)
+        if args.name is not None:
+            data_manager.rename_game(game_id, args.name)
+    data_manager.save_data()
+    print(f"{len(game_ids)} games updated")
+
+
+def cmd_delete(data_manager, args):
+    require_selection(args)
+    game_ids = select_games(data_manager, args)
+    for game_id in game_ids:
+        data_manager.delete_game(game_id)
+    data_manager.save_data()
+    print(f"{len(game_ids)} games deleted")
+
+
+def cmd_export(data_manager, args):
+    # Games are exported with their emulator's name so the file can be imported into another library
+    rows = []
+    for game_id in select_games(data_manager, args):
+        details = data_manager.games_dict[game_id]
+        rows.append({'Id': game_id, 'Game': details['Game'],
+                     'Application': data_manager.emulator_name(details['Emulator_id']),
+                     'Options': details['Options'], 'Notes': data_manager.notes(game_id)})
+    out = open(args.file, 'w', newline='', encoding='utf-8') if args.file != '-' else sys.stdout
+    try:
+        if args.format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, out, indent=4)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{len(rows)} games exported", file=sys.stderr)
+
+
+def cmd_import(data_manager, args):
+    with open(args.file, 'r', newline='', encoding='utf-8') as in_file:
+        if args.file.lower().endswith('.csv'):
+            rows = list(csv.DictReader(in_file))
+        else:
+            rows = json.load(in_file)
+    added = 0
+    skipped = 0
+    emu_id = emulator_arg(data_manager, args.emulator) if args.emulator else None
+    for row in rows:
+        row_emu_id = emu_id or data_manager.emulator_id(row.get('Application', ''))
+        game_name = row.get('Game') or ''
+        # Rows without a game name, or naming one already set up, are left out
+        if row_emu_id is None or not game_name or data_manager.find_game(row_emu_id, game_name) is not None:
+            skipped += 1
+            continue
+        data_manager.add_game(row_emu_id, game_name, row.get('Options') or '', row.get('Notes') or '')
+        added += 1
+    data_manager.save_data()
+    print(f"{added} games imported, {skipped} skipped")
+
+
+def cmd_scan(data_manager, args):
+    emu_dict = data_manager.emu_dict
+    if args.emulator:
+        emu_id = emulator_arg(data_manager, args.emulator)
+        emu_dict = {emu_id: emu_dict[emu_id]}
+    scanner = LibraryScanner(os.path.join(data_manager.datastorelocation, 'scan_cache.json'))
+    found = scanner.scan(emu_dict, lambda done, found: print(f"\r{done} folders checked, {found} new files found",
+                                                             end='', file=sys.stderr),
+                         full=args.full)
+    print(file=sys.stderr)
+    added = data_manager.import_games(found)
+    scanner.save_cache()
+    print(f"{added} new games added to the library")
+
+
+def cmd_check(data_manager, args):
+    game_ids = select_games(data_manager, args)
+    games = {game_id: data_manager.games_dict[game_id] for game_id in game_ids}
+    broken = PathChecker().check(games, data_manager.emu_dict)
+    for game_id in game_ids:
+        if game_id in broken:
+            details = games[game_id]
+            print(f"{game_id}\t{data_manager.emulator_name(details['Emulator_id'])}\t{details['Game']}\t"
+                  f"{'; '.join(broken[game_id])}")
+    print(f"{len(broken)} of {len(game_ids)} games have missing files", file=sys.stderr)
+
+
+def cmd_duplicates(data_manager, args):
+    games = {game_id: data_manager.games_dict[game_id] for game_id in select_games(data_manager, args)}
+    hasher = ContentHasher(os.path.join(data_manager.datastorelocation, 'hash_cache.json'))
+    groups = hasher.duplicates(games, data_manager.emu_dict,
+                               lambda done, total: print(f"\r{done} of {total} files hashed", end='', file=sys.stderr))
+    print(file=sys.stderr)
+    hasher.save_cache()
+    for sha1, size, members in groups:
+        print(f"{sha1}\t{size}")
+        for game_id, path in members:
+            details = games[game_id]
+            print(f"    {game_id}\t{data_manager.emulator_name(details['Emulator_id'])}\t{details['Game']}\t{path}")
+    print(f"{len(groups)} sets of games share the same file contents", file=sys.stderr)
+
+
+def cmd_test(data_manager, args):
+    game_ids = select_games(data_manager, args)
+    games = {game_id: data_manager.games_dict[game_id] for game_id in game_ids}
+    tester = LaunchTester(args.timeout, args.workers)
+    results = tester.run(games, data_manager.emu_dict,
+                         lambda done, total: print(f"\r{done} of {total} games tested", end='', file=sys.stderr))
+    print(file=sys.stderr)
+    data_manager.record_tests(results)
+    report = []
+    for game_id in game_ids:
+        passed, result = results[game_id]
+        details = games[game_id]
+        report.append({'Id': game_id, 'Game': details['Game'],
+                       'Application': data_manager.emulator_name(details['Emulator_id']),
+                       'Passed': passed, 'Result': result})
+        if not passed or args.all:
+            print(f"{game_id}\t{report[-1]['Application']}\t{details['Game']}\t"
+                  f"{'passed' if passed else 'FAILED'}\t{result}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=4)
+    failed = sum(not row['Passed'] for row in report)
+    print(f"{failed} of {len(game_ids)} games failed to launch", file=sys.stderr)
+
+
+def cmd_prune_notes(data_manager, args):
+    print(f"{data_manager.prune_notes()} unused notes files deleted")
+
+
+def cmd_launch(data_manager, args):
+    if args.id not in data_manager.games_dict:
+        raise SystemExit(f"Unknown game id: {args.id}")
+    details = data_manager.games_dict[args.id]
+    emu = data_manager.emu_dict.get(details['Emulator_id'])
+    if emu is None:
+        raise SystemExit(f"{details['Game']} has no emulator, its emulator was removed")
+    if not emu['Location']:
+        raise SystemExit(f"Set the location of {emu['Name']} before launching {details['Game']}")
+    finished = threading.Event()
+    result = []
+
+    def on_finished(*play):
+        result.extend(play)
+        finished.set()
+
+    launch_manager = LaunchManager(on_finished)
+    launch_manager.launch(args.id, emu['Location'], details['Options'],
+                          emu['Working_Directory'], emu.get('Use_shell', False))
+    print(f"Started {details['Game']}")
+    if args.wait:
+        finished.wait()
+        data_manager.record_play(*result)
+        print(f"{details['Game']} exited with code {result[-1]}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Retro Roaming library from the command line")
+    parser.add_argument('--data-dir', default=None,
+                        help=f"folder holding the library (default {default_data_location()})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_selection(sub, ids=True):
+        if ids:
+            sub.add_argument('ids', nargs='*', help="game ids, default is every game matched by the filters")
+        sub.add_argument('--emulator', help="only games for this emulator")
+        sub.add_argument('--search', help="only games whose name, notes or options match")
+
+    sub = commands.add_parser('emulators', help="list the emulators and how many games each has")
+    sub.set_defaults(func=cmd_emulators)
+
+    sub = commands.add_parser('list', help="list games as id, emulator and name")
+    add_selection(sub, ids=False)
+    sub.set_defaults(func=cmd_list)
+
+    sub = commands.add_parser('add', help="add a game")
+    sub.add_argument('emulator')
+    sub.add_argument('name')
+    sub.add_argument('--file', help="game file, added to the options with the emulator's default option")
+    sub.add_argument('--options', default='')
+    sub.add_argument('--notes', default='')
+    sub.set_defaults(func=cmd_add)
+
+    sub = commands.add_parser('edit', help="change the name, options or notes of games")
+    add_selection(sub)
+    sub.add_argument('--name')
+    sub.add_argument('--options')
+    sub.add_argument('--replace-options', nargs=2, metavar=('OLD', 'NEW'),
+                     help="replace text in the options, e.g. after moving a library")
+    sub.add_argument('--notes')
+    sub.set_defaults(func=cmd_edit)
+
+    sub = commands.add_parser('delete', help="delete games")
+    add_selection(sub)
+    sub.set_defaults(func=cmd_delete)
+
+    sub = commands.add_parser('export', help="write games to a JSON or CSV file")
+    add_selection(sub, ids=False)
+    sub.add_argument('file', help="file to write, - for standard output")
+    sub.add_argument('--format', choices=['json', 'csv'], default='json')
+    sub.set_defaults(func=cmd_export)
+
+    sub = commands.add_parser('import', help="add games from a JSON or CSV file made by export")
+    sub.add_argument('file')
+    sub.add_argument('--emulator', help="add every game to this emulator instead of the one in the file")
+    sub.set_defaults(func=cmd_import)
+
+    sub = commands.add_parser('scan', help="import new game files from the emulators' default game directories")
+    sub.add_argument('--emulator', help="only scan this emulator's directory")
+    sub.add_argument('--full', action='store_true', help="ignore the scan cache and look at every file")
+    sub.set_defaults(func=cmd_scan)
+
+    sub = commands.add_parser('check', help="list games whose emulator, working directory or files are missing")
+    add_selection(sub, ids=False)
+    sub.set_defaults(func=cmd_check)
+
+    sub = commands.add_parser('duplicates', help="group games whose files have the same contents")
+    add_selection(sub, ids=False)
+    sub.set_defaults(func=cmd_duplicates)
+
+    sub = commands.add_parser('test', help="start games side by side and list the ones that fail to run")
+    add_selection(sub, ids=False)
+    sub.add_argument('--timeout', type=float, default=10,
+                     help="seconds a game must keep running to pass (default 10)")
+    sub.add_argument('--workers', type=int, default=4, help="games started at the same time (default 4)")
+    sub.add_argument('--all', action='store_true', help="list the games that passed too")
+    sub.add_argument('--report', help="also write every result to this JSON file")
+    sub.set_defaults(func=cmd_test)
+
+    sub = commands.add_parser('prune-notes', help="delete stored notes that no game uses any more")
+    sub.set_defaults(func=cmd_prune_notes)
+
+    sub = commands.add_parser('launch', help="start a game")
+    sub.add_argument('id')
+    sub.add_argument('--wait', action='store_true', help="wait for the game to exit and record the play time")
+    sub.set_defaults(func=cmd_launch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Started first so the threads DataManager starts, such as the writer, are profiled too
+    profile = retro_perf.SessionProfile(args.data_dir or default_data_location())
+    data_manager = DataManager(datastorelocation=args.data_dir)
+    try:
+        args.func(data_manager, args)
+    finally:
+        data_manager.close()
+        profile_file = profile.stop()
+        if profile_file:
+            print(f"Profile written to {profile_file}", file=sys.stderr)
+        if retro_perf.stats.enabled:
+            print(retro_perf.stats.summary(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2252 @@
+#
+# Retro Roaming core - the library model, storage and launching, with no dependency on wx
+# so it can be used from the command line and scripts as well as the window.
+#
+import array
+import collections
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import signal
+import struct
+import subprocess
+import sys
+import json
+import sqlite3
+import concurrent.futures
+import hashlib
+import stat
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from retro_perf import stats as perf_stats, timed
+
+
+def write_file_atomic(path, text):
+    """Write through a temporary file and swap it in so a crash never leaves a half written file.
+
+    Returns the number of characters written.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as tf:
+            tf.write(text)
+            tf.flush()
+            os.fsync(tf.fileno())
+        os.replace(tmp_path, path)
+        return len(text)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def file_signature(path):
+    """Return what identifies one version of a file, or None if there is no file."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class ExternalChangeError(IOError):
+    """A library file was changed by another program since it was last loaded or saved."""
+
+
+def upgrade_name_keyed(emu_dict):
+    """Give each emulator saved under its name an id, returns the emulators keyed by id.
+
+    Libraries from before emulator ids keyed emulators by name and each game named its
+    emulator in an Application field, GameRecord.from_dict converts the games.
+    """
+    return {str(uuid.uuid4()): {'Name': emu_name, **details} for emu_name, details in emu_dict.items()}
+
+
+def missing_emulator(emu_name):
+    """Return an emulator record for games naming an emulator that has gone, its location is left to set."""
+    return {'Name': emu_name or 'Unknown emulator', 'Location': '', 'Library_default': '',
+            'Default_option': '', 'Working_Directory': ''}
+
+
+class JsonStorage:
+    """Stores the library in the two JSON files, a save rewrites whichever file has changes."""
+
+    def __init__(self, datastorelocation):
+        self.emu_file = os.path.join(datastorelocation, 'emu_data.json')
+        self.game_file = os.path.join(datastorelocation, 'games_data.json')
+        self.upgraded = False
+        # path -> file_signature as last loaded or saved, anything else was written by someone else
+        self.signatures = {}
+
+    def exists(self):
+        return os.path.isfile(self.emu_file) or os.path.isfile(self.game_file)
+
+    def notes_keys(self):
+        """Return the notes keys of every game saved, whether loaded or not."""
+        if not os.path.isfile(self.game_file):
+            return set()
+        with open(self.game_file, 'r') as gf:
+            return {details.get('Notes_key', '') for details in json.load(gf).values()}
+
+    def is_loaded(self, emu_id):
+        # Both files are always read whole
+        return True
+
+    def loaded_ids(self):
+        """Return a copy of the ids of the emulators whose games are loaded, None when all of them are."""
+        return None
+
+    def watched_files(self):
+        return [self.emu_file, self.game_file]
+
+    def changed_on_disk(self):
+        return any(file_signature(path) != self.signatures.get(path) for path in self.watched_files())
+
+    def load(self):
+        """Return the emulators and the GameRecords by id, missing files load as empty.
+
+        Files saved before emulators had ids are read too, upgraded is then set so the
+        caller can save the library back in the new form.
+        """
+        self.upgraded = False
+        emu_dict = {}
+        games_dict = {}
+        # Taken before reading so a change made while the file is read is picked up next time
+        self.signatures = {path: file_signature(path) for path in self.watched_files()}
+        if os.path.isfile(self.emu_file):
+            with open(self.emu_file, 'r') as ef:
+                emu_dict = json.load(ef)
+        if any('Name' not in details for details in emu_dict.values()):
+            emu_dict = upgrade_name_keyed(emu_dict)
+            self.upgraded = True
+        emulator_ids = {details['Name']: emu_id for emu_id, details in emu_dict.items()}
+
+        def as_record(details):
+            # Each game becomes a GameRecord as it is parsed so the dicts never all exist at once
+            if 'Game' not in details:
+                return details
+            if 'Emulator_id' not in details:
+                self.upgraded = True
+            return GameRecord.from_dict(details, emulator_ids)
+
+        if os.path.isfile(self.game_file):
+            with open(self.game_file, 'r') as gf:
+                games_dict = json.load(gf, object_hook=as_record)
+        # Games naming an emulator that has gone get it back without a location, setting one reattaches them
+        for emu_name, emu_id in emulator_ids.items():
+            if emu_id not in emu_dict:
+                emu_dict[emu_id] = missing_emulator(emu_name)
+        return emu_dict, games_dict
+
+    def snapshot(self, emu_dict, games_dict, changed_emus, changed_games):
+        """Take what save needs while the caller holds the data lock."""
+        return (dict(emu_dict) if changed_emus else None,
+                dict(games_dict) if changed_games else None)
+
+    def save(self, snapshot):
+        """Write the snapshot, returns the number of bytes written.
+
+        Raises ExternalChangeError rather than overwrite a file someone else has changed.
+        """
+        emu_dict, games_dict = snapshot
+        written = 0
+        if emu_dict is not None:
+            written += self._write(self.emu_file, json.dumps(emu_dict, indent=4))
+        if games_dict is not None:
+            written += self._write(self.game_file, json.dumps(games_dict, indent=4, default=GameRecord.to_dict))
+        return written
+
+    def _write(self, path, text):
+        if file_signature(path) != self.signatures.get(path):
+            raise ExternalChangeError(f"{path} was changed by another program")
+        written = write_file_atomic(path, text)
+        self.signatures[path] = file_signature(path)
+        return written
+
+
+class ShardedStorage(JsonStorage):
+    """Stores each emulator's games in a file of their own, with the emulators in a small manifest.
+
+    The games can be loaded one emulator at a time as each is first shown, and a save
+    only rewrites the manifest and the shards holding changes.
+    """
+
+    def __init__(self, datastorelocation):
+        self.folder = os.path.join(datastorelocation, 'library')
+        self.manifest_file = os.path.join(self.folder, 'manifest.json')
+        self.upgraded = False
+        self.signatures = {}
+        # Emulator ids whose shard has been loaded, None when every shard is loaded
+        self.loaded = None
+        # Which shard each game is saved in, so a save knows which shards a change touches
+        self.shard_games = {}
+        self.game_shards = {}
+        # Shards are added on the UI thread while a merge reloads on the watcher thread
+        self.lock = threading.Lock()
+
+    def shard_file(self, emu_id):
+        return os.path.join(self.folder, f'games_{emu_id}.json')
+
+    def exists(self):
+        return os.path.isfile(self.manifest_file)
+
+    def watched_files(self):
+        return [self.manifest_file] + [path for path in self.signatures if path != self.manifest_file]
+
+    def shard_ids(self):
+        """Return the ids of every shard in the folder, including games whose emulator has gone."""
+        if not os.path.isdir(self.folder):
+            return set()
+        return {name[len('games_'):-len('.json')] for name in os.listdir(self.folder)
+                if name.startswith('games_') and name.endswith('.json')}
+
+    def notes_keys(self):
+        keys = set()
+        for emu_id in self.shard_ids():
+            with open(self.shard_file(emu_id), 'r') as sf:
+                keys.update(details.get('Notes_key', '') for details in json.load(sf).values())
+        return keys
+
+    def load(self):
+        """Return the emulators and the games, only those of shards already loaded after load_manifest.
+
+        A full load also reads the shards of games whose emulator has gone, they stay hidden
+        as they always have but are kept and can be migrated.
+        """
+        loaded = self.loaded_ids()
+        emu_dict, signature = self._read_manifest()
+        # Built up here and swapped in at the end, other threads check what is loaded without a lock
+        signatures = {self.manifest_file: signature}
+        shard_games = {}
+        game_shards = {}
+        games_dict = {}
+        for emu_id in (emu_dict.keys() | self.shard_ids() if loaded is None else loaded):
+            shard, signatures[self.shard_file(emu_id)] = self.read_shard(emu_id)
+            shard_games[emu_id] = set(shard)
+            game_shards.update(dict.fromkeys(shard, emu_id))
+            games_dict.update(shard)
+        with self.lock:
+            # Shards added while these were read keep what add_shard gave them
+            for emu_id in (set() if loaded is None else self.loaded - loaded):
+                path = self.shard_file(emu_id)
+                signatures[path] = self.signatures.get(path)
+                shard_games[emu_id] = self.shard_games.get(emu_id, set())
+                game_shards.update(dict.fromkeys(shard_games[emu_id], emu_id))
+            self.signatures, self.shard_games, self.game_shards = signatures, shard_games, game_shards
+        return emu_dict, games_dict
+
+    def load_manifest(self):
+        """Return just the emulators, their games are then loaded one shard at a time."""
+        emu_dict, signature = self._read_manifest()
+        with self.lock:
+            self.loaded = set()
+            self.shard_games = {}
+            self.game_shards = {}
+            self.signatures = {self.manifest_file: signature}
+        return emu_dict
+
+    def _read_manifest(self):
+        signature = file_signature(self.manifest_file)
+        if not os.path.isfile(self.manifest_file):
+            return {}, signature
+        with open(self.manifest_file, 'r') as mf:
+            return json.load(mf), signature
+
+    def load_shard(self, emu_id):
+        """Return the games of one emulator."""
+        games_dict, signature = self.read_shard(emu_id)
+        self.add_shard(emu_id, games_dict, signature)
+        return games_dict
+
+    def read_shard(self, emu_id):
+        """Return (games, signature) for one emulator without marking it loaded, safe on any thread."""
+        path = self.shard_file(emu_id)
+        signature = file_signature(path)
+        games_dict = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as sf:
+                games_dict = json.load(sf, object_hook=lambda d: GameRecord.from_dict(d) if 'Game' in d else d)
+        return games_dict, signature
+
+    def add_shard(self, emu_id, games_dict, signature):
+        """Mark a shard from read_shard as loaded, a change made since it was read is merged in later."""
+        with self.lock:
+            self.signatures[self.shard_file(emu_id)] = signature
+            self.shard_games[emu_id] = set(games_dict)
+            self.game_shards.update(dict.fromkeys(games_dict, emu_id))
+            if self.loaded is not None:
+                self.loaded.add(emu_id)
+
+    def is_loaded(self, emu_id):
+        return self.loaded is None or emu_id in self.loaded
+
+    def loaded_ids(self):
+        with self.lock:
+            return None if self.loaded is None else set(self.loaded)
+
+    def snapshot(self, emu_dict, games_dict, changed_emus, changed_games):
+        """Take the manifest and the shards touched by the changes while the caller holds the data lock."""
+        dirty = set()
+        for game_id in changed_games:
+            old_emu = self.game_shards.pop(game_id, None)
+            if old_emu is not None:
+                self.shard_games[old_emu].discard(game_id)
+                dirty.add(old_emu)
+            details = games_dict.get(game_id)
+            if details is not None:
+                emu_id = details['Emulator_id']
+                self.game_shards[game_id] = emu_id
+                self.shard_games.setdefault(emu_id, set()).add(game_id)
+                dirty.add(emu_id)
+        deleted = {emu_id for emu_id in changed_emus if emu_id not in emu_dict}
+        shards = {emu_id: {game_id: games_dict[game_id] for game_id in self.shard_games[emu_id]}
+                  for emu_id in dirty - deleted}
+        return dict(emu_dict) if changed_emus else None, shards, deleted
+
+    def save(self, snapshot):
+        """Write the snapshot, returns the number of bytes written.
+
+        Raises ExternalChangeError rather than overwrite a file someone else has changed.
+        """
+        emu_dict, shards, deleted = snapshot
+        os.makedirs(self.folder, exist_ok=True)
+        written = 0
+        # Shards go first so the manifest never lists an emulator whose games aren't saved
+        for emu_id, games_dict in shards.items():
+            written += self._write(self.shard_file(emu_id),
+                                   json.dumps(games_dict, indent=4, default=GameRecord.to_dict))
+        if emu_dict is not None:
+            written += self._write(self.manifest_file, json.dumps(emu_dict, indent=4))
+        for emu_id in deleted:
+            self.shard_games.pop(emu_id, None)
+            path = self.shard_file(emu_id)
+            self.signatures.pop(path, None)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return written
+
+
+class SqliteStorage:
+    """Stores the library in an SQLite database, saves only write the records that changed."""
+
+    # (record key, column name), any other keys on a record are kept in the extra column as JSON
+    EMU_COLUMNS = [('Name', 'name'), ('Location', 'location'), ('Library_default', 'library_default'),
+                   ('Default_option', 'default_option'), ('Working_Directory', 'working_directory')]
+    GAME_COLUMNS = [('Game', 'game'), ('Emulator_id', 'emulator_id'), ('Options', 'options'),
+                    ('Notes_key', 'notes_key')]
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS emulators (
+               id TEXT PRIMARY KEY, name TEXT, location TEXT, library_default TEXT,
+               default_option TEXT, working_directory TEXT, extra TEXT)""",
+        """CREATE TABLE IF NOT EXISTS games (
+               id TEXT PRIMARY KEY, game TEXT, emulator_id TEXT,
+               options TEXT, notes_key TEXT, extra TEXT)""",
+        "CREATE INDEX IF NOT EXISTS games_by_emulator ON games (emulator_id, game)",
+    ]
+    # Tables from before the notes store held the notes text, it is put in extra for DataManager to move out
+    OLD_NOTES = "CASE WHEN COALESCE(g.notes, '') = '' THEN g.extra " \
+                "ELSE json_set(COALESCE(g.extra, '{}'), '$.Notes', g.notes) END"
+
+    def __init__(self, datastorelocation):
+        self.db_file = os.path.join(datastorelocation, 'library.db')
+        # The database upgrades itself in connect so there is never anything left to save
+        self.upgraded = False
+        self.signatures = {}
+        # Emulator ids whose games have been loaded, None when every game is loaded
+        self.loaded = None
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.isfile(self.db_file)
+
+    def notes_keys(self):
+        """Return the notes keys of every game saved, whether loaded or not."""
+        if not self.exists():
+            return set()
+        conn = self.connect()
+        try:
+            return {row[0] for row in conn.execute("SELECT DISTINCT notes_key FROM games")}
+        finally:
+            conn.close()
+
+    def watched_files(self):
+        return [self.db_file]
+
+    def changed_on_disk(self):
+        return file_signature(self.db_file) != self.signatures.get(self.db_file)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_file)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(emulators)")]
+        if columns and 'id' not in columns:
+            self._upgrade_name_keyed(conn)
+        elif 'notes' in [row[1] for row in conn.execute("PRAGMA table_info(games)")]:
+            self._upgrade_notes(conn)
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def _upgrade_name_keyed(self, conn):
+        """Move a database from before emulator ids to the id keyed tables in one transaction."""
+        conn.execute("BEGIN")
+        with conn:
+            conn.execute("ALTER TABLE emulators RENAME TO emulators_by_name")
+            conn.execute("ALTER TABLE games RENAME TO games_by_name")
+            conn.execute("DROP INDEX IF EXISTS games_by_emulator")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            # Games whose emulator has gone get an emulator of that name without a location, see missing_emulator
+            names = {row[0] for row in conn.execute(
+                "SELECT name FROM emulators_by_name UNION SELECT application FROM games_by_name")}
+            conn.execute("CREATE TEMP TABLE emulator_ids (name TEXT PRIMARY KEY, id TEXT)")
+            conn.executemany("INSERT INTO emulator_ids VALUES (?, ?)",
+                             ((name, str(uuid.uuid4())) for name in names))
+            conn.execute("""INSERT INTO emulators
+                            SELECT i.id, e.name, e.location, e.library_default, e.default_option,
+                                   e.working_directory, e.extra
+                            FROM emulators_by_name e JOIN emulator_ids i ON i.name = e.name""")
+            conn.execute("""INSERT INTO emulators
+                            SELECT i.id, CASE WHEN i.name = '' THEN 'Unknown emulator' ELSE i.name END,
+                                   '', '', '', '', NULL
+                            FROM emulator_ids i WHERE i.name NOT IN (SELECT name FROM emulators_by_name WHERE name IS NOT NULL)""")
+            conn.execute(f"""INSERT INTO games
+                            SELECT g.id, g.game, i.id, g.options, '', {self.OLD_NOTES}
+                            FROM games_by_name g JOIN emulator_ids i ON i.name = g.application""")
+            conn.execute("DROP TABLE emulators_by_name")
+            conn.execute("DROP TABLE games_by_name")
+            conn.execute("DROP TABLE emulator_ids")
+
+    def _upgrade_notes(self, conn):
+        """Move a games table from before the notes store to one holding a notes key, in one transaction."""
+        conn.execute("BEGIN")
+        with conn:
+            conn.execute("ALTER TABLE games RENAME TO games_with_notes")
+            conn.execute("DROP INDEX IF EXISTS games_by_emulator")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"""INSERT INTO games
+                             SELECT g.id, g.game, g.emulator_id, g.options, '', {self.OLD_NOTES}
+                             FROM games_with_notes g""")
+            conn.execute("DROP TABLE games_with_notes")
+
+    @staticmethod
+    def _to_row(key, details, columns):
+        extra = {k: v for k, v in details.items() if k not in dict(columns)}
+        return [key] + [details.get(field, '') for field, _col in columns] + [json.dumps(extra) if extra else None]
+
+    @staticmethod
+    def _from_row(row, columns):
+        details = {field: value for (field, _col), value in zip(columns, row[1:])}
+        if row[-1]:
+            details.update(json.loads(row[-1]))
+        return row[0], details
+
+    def _games(self, conn, where='', params=()):
+        return {game_id: GameRecord.from_dict(details) for game_id, details in
+                (self._from_row(row, self.GAME_COLUMNS) for row in conn.execute(f"SELECT * FROM games {where}", params))}
+
+    def load(self):
+        """Return the emulators and the games, only those of emulators already loaded after load_manifest."""
+        conn = self.connect()
+        self.signatures[self.db_file] = file_signature(self.db_file)
+        try:
+            emu_dict = dict(self._from_row(row, self.EMU_COLUMNS)
+                            for row in conn.execute("SELECT * FROM emulators"))
+            loaded = self.loaded_ids()
+            if loaded is None:
+                games_dict = self._games(conn)
+            else:
+                games_dict = {}
+                for emu_id in loaded:
+                    games_dict.update(self._games(conn, "WHERE emulator_id = ?", (emu_id,)))
+        finally:
+            conn.close()
+        return emu_dict, games_dict
+
+    def load_manifest(self):
+        """Return just the emulators, their games are then loaded one emulator at a time."""
+        self.loaded = set()
+        conn = self.connect()
+        self.signatures[self.db_file] = file_signature(self.db_file)
+        try:
+            return dict(self._from_row(row, self.EMU_COLUMNS) for row in conn.execute("SELECT * FROM emulators"))
+        finally:
+            conn.close()
+
+    def load_shard(self, emu_id):
+        """Return the games of one emulator, read through the games_by_emulator index."""
+        games_dict, signature = self.read_shard(emu_id)
+        self.add_shard(emu_id, games_dict, signature)
+        return games_dict
+
+    def read_shard(self, emu_id):
+        """Return (games, None) for one emulator without marking it loaded, safe on any thread."""
+        conn = self.connect()
+        try:
+            return self._games(conn, "WHERE emulator_id = ?", (emu_id,)), None
+        finally:
+            conn.close()
+
+    def add_shard(self, emu_id, games_dict, signature):
+        with self.lock:
+            if self.loaded is not None:
+                self.loaded.add(emu_id)
+
+    def is_loaded(self, emu_id):
+        return self.loaded is None or emu_id in self.loaded
+
+    def loaded_ids(self):
+        with self.lock:
+            return None if self.loaded is None else set(self.loaded)
+
+    def snapshot(self, emu_dict, games_dict, changed_emus, changed_games):
+        """Take the changed records while the caller holds the data lock, None marks a delete."""
+        return ({emu_id: emu_dict.get(emu_id) for emu_id in changed_emus},
+                {game_id: games_dict.get(game_id) for game_id in changed_games})
+
+    def save(self, snapshot):
+        """Write the snapshot, returns roughly how many bytes of record data were written."""
+        changed_emus, changed_games = snapshot
+        written = 0
+        changed_elsewhere = self.changed_on_disk()
+        emu_sql = f"INSERT OR REPLACE INTO emulators VALUES ({', '.join('?' * (len(self.EMU_COLUMNS) + 2))})"
+        game_sql = f"INSERT OR REPLACE INTO games VALUES ({', '.join('?' * (len(self.GAME_COLUMNS) + 2))})"
+        conn = self.connect()
+        try:
+            # One transaction per save, either every change lands or none of them do
+            with conn:
+                for emu_id, details in changed_emus.items():
+                    if details is not None:
+                        row = self._to_row(emu_id, details, self.EMU_COLUMNS)
+                        conn.execute(emu_sql, row)
+                        written += sum(len(str(value)) for value in row if value is not None)
+                    else:
+                        conn.execute("DELETE FROM emulators WHERE id = ?", (emu_id,))
+                for game_id, details in changed_games.items():
+                    if details is not None:
+                        row = self._to_row(game_id, details, self.GAME_COLUMNS)
+                        conn.execute(game_sql, row)
+                        written += sum(len(str(value)) for value in row if value is not None)
+                    else:
+                        conn.execute("DELETE FROM games WHERE id = ?", (game_id,))
+        finally:
+            conn.close()
+        # Each save only touches its own records so other programs' changes are never overwritten,
+        # they are still there to merge when the database had changed before this save
+        if not changed_elsewhere:
+            self.signatures[self.db_file] = file_signature(self.db_file)
+        return written
+
+
+class NotesStore:
+    """Keeps each game's notes in a file named by the SHA-1 of the text, outside the game records.
+
+    Records only hold the key so notes are read when a game is shown and written when they
+    change, the last cache_size notes read are kept in memory. The empty string is key ''.
+    New notes are held in pending until flush writes them, so editing a game never waits on the disk.
+    """
+
+    def __init__(self, folder, cache_size=64):
+        self.folder = folder
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key_for(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest() if text else ''
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key[:2], f'{key}.txt')
+
+    def put(self, text):
+        """Queue the text to be stored by the next flush and return its key."""
+        key = self.key_for(text)
+        if not key:
+            return key
+        with self.lock:
+            self.pending[key] = text
+        self._remember(key, text)
+        return key
+
+    def flush(self):
+        """Write the notes put since the last flush that aren't stored already, called by the writer."""
+        with self.lock:
+            pending = dict(self.pending)
+        for key, text in pending.items():
+            path = self.path_for(key)
+            if not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                perf_stats.add_bytes('notes', write_file_atomic(path, text))
+            # Only dropped once written, a failed write is tried again by the next flush
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def read(self, key):
+        """Return the text for a key without keeping it in the cache, for bulk reads."""
+        if not key:
+            return ''
+        with self.lock:
+            text = self.cache.get(key)
+            if text is None:
+                text = self.pending.get(key)
+        if text is not None:
+            return text
+        perf_stats.count('notes read')
+        try:
+            with open(self.path_for(key), 'r', encoding='utf-8') as nf:
+                return nf.read()
+        except FileNotFoundError:
+            return ''
+
+    def get(self, key):
+        """Return the text for a key, keeping it in the cache of recently viewed notes."""
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                perf_stats.count('notes cache hits')
+                return self.cache[key]
+        text = self.read(key)
+        if key:
+            self._remember(key, text)
+        return text
+
+    def _remember(self, key, text):
+        with self.lock:
+            self.cache[key] = text
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def prune(self, keys):
+        """Delete the stored notes whose key isn't in keys, returns how many were deleted."""
+        removed = 0
+        with self.lock:
+            # Notes waiting to be written belong to games not saved yet
+            keys = set(keys) | set(self.pending)
+        if not os.path.isdir(self.folder):
+            return removed
+        for entry in os.scandir(self.folder):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                key, ext = os.path.splitext(blob.name)
+                if ext == '.txt' and key not in keys:
+                    os.remove(blob.path)
+                    removed += 1
+        return removed
+
+
+class BackgroundWriter:
+    """Runs a save function on a worker thread, saves requested within the debounce window share one write."""
+
+    def __init__(self, save_func, debounce=0.5, on_error=None):
+        self.save_func = save_func
+        self.debounce = debounce
+        # on_error(message) is called on the worker thread, there may be no console to print to
+        self.on_error = on_error or print_error
+        self.condition = threading.Condition()
+        self.dirty = False
+        self.saving = False
+        self.flushing = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name='RetroRoamingWriter', daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self):
+        """Ask for a save, returns straight away."""
+        with self.condition:
+            self.dirty = True
+            self.condition.notify_all()
+
+    def flush(self):
+        """Write any pending save now and wait for it to finish."""
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            while (self.dirty or self.saving) and self.thread.is_alive():
+                self.condition.wait()
+            self.flushing = False
+
+    def stop(self):
+        """Flush and shut the worker thread down."""
+        self.flush()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        with self.condition:
+            while True:
+                while not self.dirty and not self.stopped:
+                    self.condition.wait()
+                if not self.dirty:
+                    return
+                # Hold off for the debounce window so a burst of edits becomes one write
+                deadline = time.monotonic() + self.debounce
+                while not self.flushing and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                self.dirty = False
+                self.saving = True
+                self.condition.release()
+                try:
+                    self.save_func()
+                except Exception as e:
+                    self.on_error(f"Background save failed: {e}")
+                finally:
+                    self.condition.acquire()
+                    self.saving = False
+                    self.condition.notify_all()
+
+
+class FileWatcher:
+    """Calls on_change() on a worker thread soon after any of the files is written.
+
+    paths is a list, or a function returning the list when the files in use can change.
+    Uses inotify on Linux, elsewhere the files' signatures are checked every interval seconds.
+    A burst of writes is given settle seconds to finish and becomes one call.
+    """
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, paths, on_change, interval=2.0, settle=0.3, on_error=None):
+        self.get_paths = paths if callable(paths) else (lambda: list(paths))
+        self.on_change = on_change
+        self.on_error = on_error or print_error
+        self.interval = interval
+        self.settle = settle
+        self.stopped = threading.Event()
+        self.inotify_fd = self._start_inotify()
+        self.thread = threading.Thread(target=self._run, name='RetroRoamingWatcher', daemon=True)
+        self.thread.start()
+
+    def _start_inotify(self):
+        """Return an inotify descriptor watching the files' folders, or None to poll instead."""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        # Saves replace the file with a new one, so watch the folder rather than the file
+        for folder in {os.path.dirname(os.path.abspath(path)) for path in self.get_paths()}:
+            if libc.inotify_add_watch(fd, os.fsencode(folder),
+                                      self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+                os.close(fd)
+                return None
+        return fd
+
+    def _read_events(self):
+        """Return True if any waiting inotify event is for one of the watched files."""
+        seen = False
+        names = {os.path.basename(path) for path in self.get_paths()}
+        while True:
+            try:
+                data = os.read(self.inotify_fd, 65536)
+            except BlockingIOError:
+                return seen
+            pos = 0
+            while pos < len(data):
+                _wd, _mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, pos)
+                pos += self.EVENT_HEADER.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+                pos += length
+                if name in names:
+                    seen = True
+
+    def _wait_for_change(self, signatures):
+        """Block until a watched file changes, returns False once stopped."""
+        while not self.stopped.is_set():
+            if self.inotify_fd is not None:
+                ready, _, _ = select.select([self.inotify_fd], [], [], 1.0)
+                if ready and self._read_events():
+                    return True
+            else:
+                if self.stopped.wait(self.interval):
+                    return False
+                current = {path: file_signature(path) for path in self.get_paths()}
+                if current != signatures:
+                    signatures.clear()
+                    signatures.update(current)
+                    return True
+        return False
+
+    def _run(self):
+        signatures = {path: file_signature(path) for path in self.get_paths()}
+        while self._wait_for_change(signatures):
+            if self.stopped.wait(self.settle):
+                return
+            if self.inotify_fd is not None:
+                self._read_events()
+            try:
+                self.on_change()
+            except Exception as e:
+                self.on_error(f"Reloading changed files failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+
+class LibraryScanner:
+    """Walks each emulator's Library_default tree on a pool of threads looking for games to import.
+
+    Directory listings are cached in scan_cache.json by path and mtime for each emulator and
+    set of extensions, a rescan only lists directories that have changed and only offers files
+    that are new since the last scan. Changing an emulator's extensions starts its cache afresh.
+    """
+
+    def __init__(self, cache_file, workers=8):
+        self.cache_file = cache_file
+        self.workers = workers
+        self.cache = {}
+        self.new_cache = {}
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, 'r') as cf:
+                    self.cache = json.load(cf)
+            except (json.JSONDecodeError, IOError):
+                self.cache = {}
+        # Caches from before they were kept per emulator are keyed by path, they are dropped
+        if any('mtime' in listings for listings in self.cache.values()):
+            self.cache = {}
+
+    @staticmethod
+    def cache_key(emu_id, extensions):
+        """Return the key an emulator's listings are cached under, a new key when its extensions change."""
+        return f"{emu_id}:{','.join(sorted(extensions))}"
+
+    @staticmethod
+    def extensions_for(emu_details):
+        """Return the set of lower case file extensions an emulator imports."""
+        rules = emu_details.get('Scan_extensions', '').replace(',', ' ').replace(';', ' ')
+        return {('.' + ext.lstrip('.')).lower() for ext in rules.split() if ext.strip('.')}
+
+    @staticmethod
+    def game_name_from_file(path):
+        """Derive a game name from a file name, 'Manic_Miner.tzx' becomes 'Manic Miner'."""
+        name = os.path.splitext(os.path.basename(path))[0]
+        return ' '.join(name.replace('_', ' ').split())
+
+    def _list_dir(self, path, cached, full):
+        """Return (listing, changed) for a directory, unchanged directories come from the cached listing."""
+        mtime = os.stat(path).st_mtime
+        if not full and cached and cached['mtime'] == mtime:
+            return cached, False
+        files = []
+        dirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        # Only the name is kept, a size would cost a stat per file and nothing reads it
+                        files.append(entry.name)
+                except OSError:
+                    continue
+        return {'mtime': mtime, 'files': files, 'dirs': dirs}, True
+
+    def scan(self, emu_dict, progress=None, cancel=None, full=False):
+        """Return a list of (emulator id, file path) for files that are new since the last scan.
+
+        full lists every directory again and offers every file found, import_games skips
+        those that already have a game.
+        progress is called as progress(directories done, files found) from the calling thread,
+        cancel is a threading.Event, when set the scan stops and returns an empty list.
+        """
+        self.new_cache = {}
+        found = []
+        done = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            for emu_id, details in emu_dict.items():
+                extensions = self.extensions_for(details)
+                root = details.get('Library_default', '')
+                if extensions and root and os.path.isdir(root):
+                    key = self.cache_key(emu_id, extensions)
+                    self.new_cache[key] = {}
+                    pending[pool.submit(self._list_dir, root, self.cache.get(key, {}).get(root), full)] = \
+                        (emu_id, extensions, key, root)
+
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    for future in pending:
+                        future.cancel()
+                    return []
+                completed, _ = concurrent.futures.wait(pending, timeout=0.2,
+                                                       return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in completed:
+                    emu_id, extensions, key, path = pending.pop(future)
+                    done += 1
+                    try:
+                        listing, changed = future.result()
+                    except OSError:
+                        continue
+                    self.new_cache[key][path] = listing
+                    cache = self.cache.get(key, {})
+                    if changed:
+                        # Only offer files that were not in the directory last time round
+                        old = [] if full else cache.get(path, {}).get('files', [])
+                        old_files = set(old)
+                        for name in listing['files']:
+                            if name not in old_files and os.path.splitext(name)[1].lower() in extensions:
+                                found.append((emu_id, os.path.join(path, name)))
+                    for sub_dir in listing['dirs']:
+                        sub_path = os.path.join(path, sub_dir)
+                        pending[pool.submit(self._list_dir, sub_path, cache.get(sub_path), full)] = \
+                            (emu_id, extensions, key, sub_path)
+                if progress is not None:
+                    progress(done, len(found))
+        return found
+
+    def save_cache(self):
+        """Keep the listings from the last scan for the next incremental scan."""
+        # Emulators left out of the scan keep theirs, those scanned drop any kept for other extensions
+        scanned = {key.split(':', 1)[0] for key in self.new_cache}
+        self.cache = {key: listings for key, listings in self.cache.items() if key.split(':', 1)[0] not in scanned}
+        self.cache.update(self.new_cache)
+        try:
+            write_file_atomic(self.cache_file, json.dumps(self.cache))
+        except IOError:
+            pass
+
+
+class PathChecker:
+    """Checks on a pool of threads that the files each game needs are still there.
+
+    Whether each path exists is cached for ttl seconds, so a repeat check of a large library
+    only stats paths it hasn't seen recently. clear() makes the next check look at them all.
+    """
+
+    def __init__(self, ttl=300, workers=16):
+        self.ttl = ttl
+        self.workers = workers
+        # path -> (exists, time checked)
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def looks_like_path(text):
+        return '/' in text or '\\' in text
+
+    @classmethod
+    def paths_for(cls, game_details, emu_details):
+        """Return the emulator, working directory and quoted option paths a game depends on."""
+        paths = []
+        location = emu_details.get('Location', '').strip('"')
+        working_dir = emu_details.get('Working_Directory', '')
+        # A bare command such as "dosbox" is found on the PATH, only check real paths
+        if cls.looks_like_path(location):
+            paths.append(location)
+        if working_dir:
+            paths.append(working_dir)
+        return paths + cls.option_paths(game_details, emu_details)
+
+    @classmethod
+    def option_paths(cls, game_details, emu_details):
+        """Return the quoted paths in a game's options, relative ones are from the working directory."""
+        working_dir = emu_details.get('Working_Directory', '')
+        return [os.path.join(working_dir, quoted) if working_dir else quoted
+                for quoted in re.findall(r'"([^"]+)"', game_details.get('Options', ''))
+                if cls.looks_like_path(quoted)]
+
+    @staticmethod
+    def _stat(path):
+        try:
+            os.stat(path)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def clear(self):
+        """Forget every cached result so the next check stats everything again."""
+        with self.lock:
+            self.cache = {}
+
+    def check(self, games, emu_dict, cancel=None):
+        """Return {game id: [missing paths]} for the games that have files missing.
+
+        games and emu_dict should be copies taken under the data lock, the check runs
+        without holding it. cancel is a threading.Event, when set the check returns None.
+        """
+        game_paths = {game_id: self.paths_for(details, emu_dict.get(details['Emulator_id'], {}))
+                      for game_id, details in games.items()}
+        exists = {}
+        to_stat = []
+        now = time.monotonic()
+        with self.lock:
+            for path in {path for paths in game_paths.values() for path in paths}:
+                cached = self.cache.get(path)
+                if cached is not None and now - cached[1] < self.ttl:
+                    exists[path] = cached[0]
+                else:
+                    to_stat.append(path)
+        perf_stats.count('path_check cache hits', len(exists))
+        perf_stats.count('path_check stats', len(to_stat))
+
+        # Network shares can take seconds to answer so the stats run side by side
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._stat, path): path for path in to_stat}
+            for future in concurrent.futures.as_completed(futures):
+                if cancel is not None and cancel.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    return None
+                path = futures[future]
+                exists[path] = found = future.result()
+                with self.lock:
+                    self.cache[path] = (found, time.monotonic())
+
+        return {game_id: missing for game_id, missing in
+                ((game_id, [path for path in paths if not exists[path]]) for game_id, paths in game_paths.items())
+                if missing}
+
+
+class ContentHasher:
+    """Works out the CRC32 and SHA-1 of game files on a pool of threads to find copies of the same image.
+
+    Each file is read once in chunks for both hashes. Results are kept in hash_cache.json
+    by path, size and mtime, so a file is only read again after it changes.
+    """
+
+    def __init__(self, cache_file, workers=4, chunk_size=1 << 20):
+        self.cache_file = cache_file
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # path -> [size, mtime_ns, crc32, sha1]
+        self.cache = {}
+        self.lock = threading.Lock()
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, 'r') as cf:
+                    self.cache = json.load(cf)
+            except (json.JSONDecodeError, IOError):
+                self.cache = {}
+
+    def file_hashes(self, path, cancel=None):
+        """Return (size, crc32, sha1) for a file, or None if it isn't a readable file."""
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        with self.lock:
+            cached = self.cache.get(path)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            perf_stats.count('hash cache hits')
+            return st.st_size, cached[2], cached[3]
+        crc = 0
+        sha1 = hashlib.sha1()
+        try:
+            with open(path, 'rb') as game_file:
+                # Both hashes release the GIL on large chunks so the pool's reads overlap
+                for chunk in iter(lambda: game_file.read(self.chunk_size), b''):
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    crc = zlib.crc32(chunk, crc)
+                    sha1.update(chunk)
+        except OSError:
+            return None
+        perf_stats.count('hash files read')
+        perf_stats.count('hash bytes read', st.st_size)
+        result = [st.st_size, st.st_mtime_ns, f"{crc:08x}", sha1.hexdigest()]
+        with self.lock:
+            self.cache[path] = result
+        return st.st_size, result[2], result[3]
+
+    def hash_files(self, paths, progress=None, cancel=None):
+        """Return {path: (size, crc32, sha1)} for the paths that are readable files.
+
+        progress is called as progress(files done, total) from the calling thread, cancel is
+        a threading.Event, when set the hashing stops and returns None.
+        """
+        paths = set(paths)
+        hashes = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.file_hashes, path, cancel): path for path in paths}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                if cancel is not None and cancel.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    return None
+                result = future.result()
+                if result is not None:
+                    hashes[futures[future]] = result
+                if progress is not None:
+                    progress(done, len(paths))
+        return hashes
+
+    def duplicates(self, games, emu_dict, progress=None, cancel=None):
+        """Return [(sha1, size, [(game id, path), ...])] for files shared by more than one game.
+
+        games and emu_dict should be copies taken under the data lock. Groups are largest file first.
+        """
+        game_files = [(game_id, path) for game_id, details in games.items()
+                      for path in PathChecker.option_paths(details, emu_dict.get(details['Emulator_id'], {}))]
+        hashes = self.hash_files((path for _game_id, path in game_files), progress, cancel)
+        if hashes is None:
+            return None
+        groups = {}
+        for game_id, path in game_files:
+            if path in hashes:
+                groups.setdefault(hashes[path][2], []).append((game_id, path))
+        return sorted(((sha1, hashes[members[0][1]][0], members) for sha1, members in groups.items()
+                       if len({game_id for game_id, _path in members}) > 1),
+                      key=lambda group: (-group[1], group[0]))
+
+    def save_cache(self):
+        """Keep the hashes for next time."""
+        with self.lock:
+            text = json.dumps(self.cache)
+        try:
+            write_file_atomic(self.cache_file, text)
+        except IOError:
+            pass
+
+
+class Prefetcher:
+    """Pulls the selected game's files into the OS file cache on a worker thread before it is launched.
+
+    A request only starts once the selection has been still for delay seconds, so scrolling
+    through the list doesn't start a read for every game passed, and a new request cancels
+    the one in progress. posix_fadvise(WILLNEED) is used where there is one, elsewhere the
+    first max_bytes of each file are read and thrown away.
+    """
+
+    def __init__(self, delay=0.3, max_bytes=512 << 20, chunk_size=1 << 20):
+        self.delay = delay
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.condition = threading.Condition()
+        self.pending = None
+        self.requested = 0.0
+        # Bumped by every request, a prefetch stops as soon as it is out of date
+        self.generation = 0
+        self.running = None
+        self.prefetched = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name='RetroRoamingPrefetch', daemon=True)
+        self.thread.start()
+
+    def request(self, key, paths):
+        """Prefetch paths for key (a game id) once the selection settles, returns straight away."""
+        with self.condition:
+            if self.pending is None and key in (self.running, self.prefetched):
+                return
+            self.pending = (key, list(paths))
+            self.requested = time.monotonic()
+            self.generation += 1
+            self.condition.notify_all()
+        perf_stats.count('prefetch requests')
+
+    def was_prefetched(self, key):
+        """True if every file for key was prefetched and nothing has been asked for since."""
+        with self.condition:
+            return self.prefetched == key
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.generation += 1
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        with self.condition:
+            while True:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                # Wait for the selection to stay put, each new request starts the wait again
+                while self.pending is not None and not self.stopped:
+                    remaining = self.requested + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.stopped:
+                    return
+                (key, paths), self.pending = self.pending, None
+                generation = self.generation
+                self.running = key
+                self.prefetched = None
+                self.condition.release()
+                try:
+                    finished = all(self._prefetch_file(path, generation) for path in paths)
+                finally:
+                    self.condition.acquire()
+                    self.running = None
+                if finished and generation == self.generation:
+                    self.prefetched = key
+                    perf_stats.count('prefetch completed')
+                else:
+                    perf_stats.count('prefetch cancelled')
+
+    def _prefetch_file(self, path, generation):
+        """Prefetch one file, returns False if a newer request came in part way through."""
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        except (OSError, ValueError):
+            return True
+        started = time.perf_counter()
+        try:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode):
+                return True
+            length = min(st.st_size, self.max_bytes)
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+                perf_stats.count('prefetch bytes', length)
+                return True
+            done = 0
+            while done < length:
+                if generation != self.generation:
+                    return False
+                chunk = os.read(fd, min(self.chunk_size, length - done))
+                if not chunk:
+                    break
+                done += len(chunk)
+            perf_stats.count('prefetch bytes', done)
+            return True
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+            if perf_stats.enabled:
+                perf_stats.record('prefetch file', time.perf_counter() - started)
+
+
+# Emulator ids are held once, game records refer to them by a small number
+EMULATOR_IDS = []
+EMULATOR_NUMBERS = {}
+_emulator_ids_lock = threading.Lock()
+
+
+def emulator_number(emu_id):
+    """Return the small number standing for an emulator id, adding the id if it is new."""
+    number = EMULATOR_NUMBERS.get(emu_id)
+    if number is None:
+        with _emulator_ids_lock:
+            number = EMULATOR_NUMBERS.get(emu_id)
+            if number is None:
+                number = len(EMULATOR_IDS)
+                EMULATOR_IDS.append(emu_id)
+                EMULATOR_NUMBERS[emu_id] = number
+    return number
+
+
+class GameRecord:
+    """One game held compactly in memory, it reads like the dict it is saved as.
+
+    Records are never changed in place, replace() returns an updated copy. Fields other
+    than the four main ones (such as play statistics) are kept in the extra dict. The notes
+    themselves are in the NotesStore, the record holds their key.
+    """
+
+    __slots__ = ('game', 'emu_number', 'options', 'notes_key', 'extra')
+
+    FIELDS = ('Game', 'Emulator_id', 'Options', 'Notes_key')
+    ATTRIBUTES = {'Game': 'game', 'Options': 'options', 'Notes_key': 'notes_key'}
+
+    def __init__(self, game, emu_id, options, notes_key='', extra=None):
+        self.game = sys.intern(game)
+        self.emu_number = emulator_number(emu_id)
+        self.options = options
+        self.notes_key = notes_key
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, details, emulator_ids=None):
+        """Make a record from a saved dict.
+
+        emulator_ids maps emulator names to ids for games saved before emulators had ids,
+        which named their emulator in an Application field.
+        """
+        emu_id = details.get('Emulator_id')
+        if emu_id is None:
+            emu_name = details.get('Application', '')
+            emu_id = emulator_ids.get(emu_name) if emulator_ids is not None else None
+            if emu_id is None:
+                # The emulator has gone, the caller adds a missing_emulator under this id and the old name
+                emu_id = str(uuid.uuid4())
+                if emulator_ids is not None:
+                    emulator_ids[emu_name] = emu_id
+        # Notes saved in the record by earlier versions stay in extra until DataManager moves them out
+        extra = {key: value for key, value in details.items() if key not in cls.FIELDS and key != 'Application'}
+        return cls(details.get('Game', ''), emu_id, details.get('Options', ''), details.get('Notes_key', ''), extra)
+
+    def to_dict(self):
+        """Return the record as saved in games_data.json."""
+        return dict(self.items())
+
+    def replace(self, **fields):
+        """Return a copy of the record with some fields changed."""
+        details = self.to_dict()
+        details.update(fields)
+        return GameRecord.from_dict(details)
+
+    def __getitem__(self, key):
+        attribute = self.ATTRIBUTES.get(key)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if key == 'Emulator_id':
+            return EMULATOR_IDS[self.emu_number]
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.FIELDS or (self.extra is not None and key in self.extra)
+
+    def keys(self):
+        return list(self.FIELDS) + list(self.extra or ())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __eq__(self, other):
+        if isinstance(other, GameRecord):
+            return (self.game == other.game and self.emu_number == other.emu_number and
+                    self.options == other.options and self.notes_key == other.notes_key and
+                    self.extra == other.extra)
+        return self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"GameRecord({self.to_dict()!r})"
+
+
+class SearchIndex:
+    """Trigram index over game names, notes and options so a search only checks likely matches.
+
+    Each time a game is added it gets a new document number, the postings for each trigram
+    are compact arrays of document numbers. Removing a game only forgets its number, the
+    arrays are rebuilt once more than half the numbers in them are stale. Notes aren't in
+    the records so their text is passed in, a game can be added again once it is read.
+    """
+
+    FIELDS = ('Game', 'Options')
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_games = []
+        self.game_docs = {}
+        self.removed = 0
+
+    @classmethod
+    def searchable_text(cls, details, notes=''):
+        return '\n'.join([details.get(field, '') for field in cls.FIELDS] + [notes]).casefold()
+
+    @staticmethod
+    def trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, game_id, details, notes=''):
+        self.remove(game_id)
+        doc = len(self.doc_games)
+        self.doc_games.append(game_id)
+        self.game_docs[game_id] = doc
+        for gram in self.trigrams(self.searchable_text(details, notes)):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array.array('I')
+            posting.append(doc)
+
+    def remove(self, game_id):
+        doc = self.game_docs.pop(game_id, None)
+        if doc is None:
+            return
+        self.doc_games[doc] = None
+        self.removed += 1
+        if self.removed > 1000 and self.removed > len(self.game_docs):
+            self._compact()
+
+    def _compact(self):
+        """Renumber the live documents and drop the stale numbers from every posting."""
+        renumber = array.array('l', [-1]) * len(self.doc_games)
+        doc_games = []
+        for doc, game_id in enumerate(self.doc_games):
+            if game_id is not None:
+                renumber[doc] = len(doc_games)
+                self.game_docs[game_id] = len(doc_games)
+                doc_games.append(game_id)
+        for gram in list(self.postings):
+            posting = array.array('I', (renumber[doc] for doc in self.postings[gram] if renumber[doc] >= 0))
+            if posting:
+                self.postings[gram] = posting
+            else:
+                del self.postings[gram]
+        self.doc_games = doc_games
+        self.removed = 0
+
+    def _candidates(self, term):
+        if len(term) < 3:
+            # Too short for a trigram, take every game holding a trigram that contains the term
+            candidates = set()
+            for gram, posting in self.postings.items():
+                if term in gram:
+                    candidates.update(posting)
+            return candidates
+        postings = sorted((self.postings.get(gram, ()) for gram in self.trigrams(term)), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def candidates(self, query):
+        """Return the ids of games holding every trigram of the query, a superset of the matches.
+
+        The caller must stop the index changing meanwhile, DataManager holds its lock.
+        """
+        terms = query.casefold().split()
+        if not terms:
+            return set()
+        candidates = None
+        for term in sorted(terms, key=len, reverse=True):
+            term_candidates = self._candidates(term)
+            candidates = term_candidates if candidates is None else candidates & term_candidates
+            if not candidates:
+                return set()
+        return {self.doc_games[doc] for doc in candidates} - {None}
+
+    def matches(self, query, games, notes_for=lambda game_id: ''):
+        """Return the ids of the candidate games whose name, notes or options contain every word in the query.
+
+        games maps the candidates to their records, notes_for(game id) returns a game's notes.
+        """
+        terms = query.casefold().split()
+        # Trigrams can match out of order so check the real text of the few candidates left,
+        # the notes are only read when the name and options aren't enough
+        return {game_id for game_id, details in games.items()
+                if all(term in self.searchable_text(details) for term in terms) or
+                all(term in self.searchable_text(details, notes_for(game_id)) for term in terms)}
+
+    def search(self, query, games_dict, notes_for=lambda game_id: ''):
+        """Return the ids of games whose name, notes or options contain every word in the query.
+
+        notes_for(game id) returns a game's notes, it is only called for the few candidates left.
+        """
+        return self.matches(query, {game_id: games_dict[game_id] for game_id in self.candidates(query)}, notes_for)
+
+
+def build_command(emu_location, options):
+    """Return the command line for a game as it would be typed at the command prompt."""
+    # Strip quotes first to avoid double quoting, then quote if the path has spaces
+    emu_path = emu_location.strip('"')
+    if ' ' in emu_path:
+        emu_path = f'"{emu_path}"'
+    # We must not wrap the entire command in an extra set of quotes as it causes
+    # cmd.exe to fail parsing quoted paths correctly.
+    return f'{emu_path} {options}'
+
+
+def split_command_line(text):
+    """Split options into arguments the way the command prompt does, double quotes group words."""
+    args = []
+    current = []
+    in_quotes = False
+    has_arg = False
+    for char in text:
+        if char == '"':
+            in_quotes = not in_quotes
+            has_arg = True
+        elif char in ' \t\r\n' and not in_quotes:
+            if has_arg:
+                args.append(''.join(current))
+                current = []
+                has_arg = False
+        else:
+            current.append(char)
+            has_arg = True
+    if has_arg:
+        args.append(''.join(current))
+    return args
+
+
+def start_game(emu_location, options, working_directory='', use_shell=False, **popen_args):
+    """Start the emulator for a game and return the process.
+
+    The emulator is started directly with the options split into arguments, use_shell
+    falls back to handing the whole command line to the command prompt.
+    """
+    if use_shell:
+        return subprocess.Popen(build_command(emu_location, options),
+                                cwd=working_directory or None, shell=True, **popen_args)
+    argv = [emu_location.strip('"')] + split_command_line(options)
+    return subprocess.Popen(argv, cwd=working_directory or None, **popen_args)
+
+
+def kill_process_tree(proc, grace=2.0):
+    """Stop a process started with new_session_args and everything it started."""
+    if os.name == 'nt':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        proc.wait()
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        proc.wait(grace)
+    except subprocess.TimeoutExpired:
+        pass
+    # Anything left in the group ignored SIGTERM, or the leader exited leaving children behind
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.wait()
+
+
+def new_session_args():
+    """Popen arguments putting a process in a group of its own so kill_process_tree can stop it all."""
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+class LaunchManager:
+    """Starts games and keeps track of them until they exit."""
+
+    def __init__(self, on_finished=None):
+        # on_finished(game_id, started, duration, exit_code) is called on a wait thread
+        self.on_finished = on_finished
+        self.running = {}
+        self.lock = threading.Lock()
+
+    def is_running(self, game_id):
+        with self.lock:
+            return game_id in self.running
+
+    def running_games(self):
+        with self.lock:
+            return list(self.running)
+
+    def launch(self, game_id, emu_location, options, working_directory='', use_shell=False):
+        """Start a game, returns the process or None if the game is already running."""
+        with self.lock:
+            if game_id in self.running:
+                return None
+            proc = start_game(emu_location, options, working_directory, use_shell)
+            started = time.time()
+            self.running[game_id] = proc
+        threading.Thread(target=self._wait, args=(game_id, proc, started),
+                         name='RetroRoamingWait', daemon=True).start()
+        return proc
+
+    def _wait(self, game_id, proc, started):
+        exit_code = proc.wait()
+        with self.lock:
+            self.running.pop(game_id, None)
+        if self.on_finished is not None:
+            self.on_finished(game_id, started, time.time() - started, exit_code)
+
+
+class LaunchTester:
+    """Starts games side by side to find the ones that no longer run, e.g. after an emulator update.
+
+    A game passes if it is still running after timeout seconds, or exits cleanly before then.
+    Each game is then stopped along with any processes it started.
+    """
+
+    def __init__(self, timeout=10, workers=4):
+        self.timeout = timeout
+        self.workers = workers
+
+    def test(self, game_details, emu_details, cancel=None):
+        """Launch one game as Run Game does, returns (passed, result) or None if cancelled."""
+        if not emu_details.get('Location'):
+            return False, "emulator is not set up"
+        with tempfile.TemporaryFile() as errors:
+            started = time.monotonic()
+            try:
+                proc = start_game(emu_details['Location'], game_details['Options'],
+                                  emu_details.get('Working_Directory', ''), emu_details.get('Use_shell', False),
+                                  stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=errors,
+                                  **new_session_args())
+            except (OSError, ValueError) as e:
+                return False, f"could not start: {e}"
+            exit_code = None
+            # Waited on in short steps so a cancel doesn't have to wait out the timeout
+            while exit_code is None and time.monotonic() - started < self.timeout:
+                if cancel is not None and cancel.is_set():
+                    kill_process_tree(proc)
+                    return None
+                try:
+                    exit_code = proc.wait(min(0.2, max(0.0, self.timeout - (time.monotonic() - started))))
+                except subprocess.TimeoutExpired:
+                    pass
+            seconds = time.monotonic() - started
+            kill_process_tree(proc)
+            if exit_code is None:
+                perf_stats.count('launch test passed')
+                return True, f"still running after {self.timeout:g}s"
+            if exit_code == 0:
+                perf_stats.count('launch test passed')
+                return True, f"exited cleanly after {seconds:.1f}s"
+            errors.seek(0)
+            last_lines = errors.read().decode('utf-8', 'replace').strip().splitlines()[-1:]
+            perf_stats.count('launch test failed')
+            return False, f"exit code {exit_code} after {seconds:.1f}s" + ''.join(f": {line}" for line in last_lines)
+
+    def run(self, games, emu_dict, progress=None, cancel=None):
+        """Return {game id: (passed, result)} for every game.
+
+        games and emu_dict should be copies taken under the data lock. progress is called as
+        progress(games done, total) from the calling thread, cancel is a threading.Event, when
+        set the running games are stopped and None is returned.
+        """
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.test, details, emu_dict.get(details['Emulator_id'], {}), cancel): game_id
+                       for game_id, details in games.items()}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                if cancel is not None and cancel.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    return None
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done, len(games))
+        return results
+
+
+def default_data_location():
+    """Return the folder the library is kept in, under the user profile."""
+    return os.path.join(os.getenv("LOCALAPPDATA", os.path.expanduser("~")), "RetroRoaming")
+
+
+def print_error(message):
+    print(message, file=sys.stderr)
+
+
+class DataManager:
+    def __init__(self, load=True, datastorelocation=None, on_error=print_error):
+        """Initialize the data storage location and load existing data unless load is False.
+
+        on_error(message) reports I/O problems, it may be called from the background writer thread.
+        """
+        self.on_error = on_error
+        self.datastorelocation = datastorelocation or default_data_location()
+        if not os.path.exists(self.datastorelocation):
+            try:
+                os.makedirs(self.datastorelocation)
+            except OSError as e:
+                self.on_error(f"Could not create data directory: {e}")
+
+        # RETROROAMING_STORAGE=sqlite or sharded switches storage, once one exists it is used by default
+        storages = {'sharded': ShardedStorage(self.datastorelocation),
+                    'sqlite': SqliteStorage(self.datastorelocation),
+                    'json': JsonStorage(self.datastorelocation)}
+        default_name = next((name for name, storage in storages.items() if storage.exists()), 'json')
+        storage_name = os.getenv("RETROROAMING_STORAGE", default_name).lower()
+        self.storage = storages.get(storage_name, storages['json'])
+        self.emu_dict = {}
+        self.games_dict = {}
+        self.notes_store = NotesStore(os.path.join(self.datastorelocation, 'notes'))
+        # Records changed since the last save, used by storage that writes per record
+        self.changed_emus = set()
+        self.changed_games = set()
+        # Indexes kept in step with the records so lookups never scan the whole library
+        # emulator id -> set of game ids, (emulator id, game name) -> game id, emulator name -> emulator id
+        self.emu_index = {}
+        self.name_index = {}
+        self.emu_names = {}
+        self.search_index = SearchIndex()
+        # Held while records change and while the writer takes its snapshot
+        self.lock = threading.RLock()
+        # Held while writing or merging in outside changes so the two never overlap
+        self.io_lock = threading.RLock()
+        self.writer = BackgroundWriter(self.write_changes, on_error=self.on_error)
+        self.watcher = None
+        self.on_external_change = None
+        # Outside changes read but not yet applied by apply_external_changes, saves wait for them
+        self.pending_merge = None
+        self.merge_again = False
+        self.call_soon = lambda function, *args: function(*args)
+        self.migrate_storage = None
+        if not self.storage.exists():
+            # Copied from the newest kind of storage there is, the json files last
+            self.migrate_storage = next((storage for storage in storages.values()
+                                         if storage is not self.storage and storage.exists()), None)
+        # (stage, seconds) for the last load
+        self.load_times = []
+        if load:
+            self.load()
+
+    @timed('load_data')
+    def load(self, progress=None, lazy=False):
+        """Load the library and build the indexes, safe to run on a background thread.
+
+        progress(message) is called at the start of each stage. With lazy set, storage that
+        can load one emulator at a time only loads the games of the first emulator by name,
+        load_emulator loads the others when they are needed.
+        """
+        with self.lock:
+            started = time.perf_counter()
+            if progress is not None:
+                progress("Loading library...")
+            self.load_data(lazy)
+            if self.migrate_storage is not None:
+                self.migrate_from(self.migrate_storage)
+                self.migrate_storage = None
+            loaded = time.perf_counter()
+            if progress is not None:
+                progress("Building indexes...")
+            self.build_indexes()
+            self.load_times = [('load data', loaded - started), ('build indexes', time.perf_counter() - loaded)]
+
+    def load_data(self, lazy=False):
+        """Load emulator and game data from storage."""
+        if not self.storage.exists():
+            return
+        try:
+            if lazy and hasattr(self.storage, 'load_manifest'):
+                emu_dict = self.storage.load_manifest()
+                games_dict = {}
+                if emu_dict:
+                    games_dict = self.storage.load_shard(min(emu_dict, key=lambda emu_id: emu_dict[emu_id]['Name']))
+            else:
+                emu_dict, games_dict = self.storage.load()
+        except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+            self.on_error(f"Error loading data: {e}")
+            return
+        moved = self._store_notes(games_dict)
+        self.emu_dict.update(emu_dict)
+        self.games_dict.update(games_dict)
+        if self.storage.upgraded:
+            # Saved before emulators had ids, write it all back in the new form
+            self.changed_emus.update(emu_dict)
+            self.changed_games.update(games_dict)
+        self.changed_games.update(moved)
+        if self.changed_emus or self.changed_games:
+            self.save_data()
+
+    def _store_notes(self, games_dict):
+        """Move notes saved inside the records into the notes store, returns the ids of the games changed.
+
+        Libraries from before the notes store kept the text in a Notes field, scripts may still write one.
+        """
+        moved = []
+        for game_id, details in games_dict.items():
+            if details.extra is not None and 'Notes' in details.extra:
+                fields = details.to_dict()
+                fields['Notes_key'] = self.notes_store.put(fields.pop('Notes') or '')
+                games_dict[game_id] = GameRecord.from_dict(fields)
+                moved.append(game_id)
+        return moved
+
+    def migrate_from(self, old_storage):
+        """One off copy of the library from the old storage into the current one."""
+        try:
+            emu_dict, games_dict = old_storage.load()
+        except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+            self.on_error(f"Error loading data to migrate: {e}")
+            return
+        self._store_notes(games_dict)
+        self.emu_dict.update(emu_dict)
+        self.games_dict.update(games_dict)
+        self.changed_emus.update(emu_dict)
+        self.changed_games.update(games_dict)
+        self.save_data()
+
+    @timed('save_data')
+    def save_data(self):
+        """Queue a save of the changed records, the write happens on the background writer."""
+        self.writer.mark_dirty()
+
+    def flush(self):
+        """Write any pending changes and wait for the write to finish."""
+        self.writer.flush()
+
+    def close(self):
+        """Stop watching, flush pending changes and stop the background writer."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.on_external_change = None
+        # Nothing is left to run what call_soon queues, so outside changes met by the last
+        # save are applied straight away and the local changes saved on top of them
+        self.call_soon = lambda function, *args: function(*args)
+        if self.pending_merge is not None:
+            # The window has gone before it applied them, they are needed before the last save
+            self.apply_external_changes(self.pending_merge)
+        self.writer.stop()
+        try:
+            # Notes put without a save after them, such as those of a game added then deleted
+            self.notes_store.flush()
+        except Exception as e:
+            self.on_error(f"Error saving notes: {e}")
+
+    def watch(self, on_external_change=None, call_soon=None):
+        """Merge in changes other programs make to the library files as soon as they are saved.
+
+        The files are read on the watcher thread, then call_soon(function, *args) runs the
+        function that applies the changes on the thread the records are used from, such as
+        wx.CallAfter. Without call_soon they are applied on the watcher thread.
+        on_external_change(emulator ids, game ids, conflicts) is called once they are applied.
+        """
+        self.on_external_change = on_external_change
+        if call_soon is not None:
+            self.call_soon = call_soon
+        # Passed as a function since sharded storage watches each shard once it is loaded
+        self.watcher = FileWatcher(self.storage.watched_files, self.merge_external_changes, on_error=self.on_error)
+
+    @timed('load_emulator')
+    def load_emulator(self, emu_id):
+        """Load the games of an emulator left out by a lazy load, returns the ids of the games added."""
+        if self.storage.is_loaded(emu_id):
+            return []
+        return self.add_emulators(self.read_emulators([emu_id]))
+
+    def load_all(self):
+        """Load the games of every emulator not yet loaded, returns the ids of the games added."""
+        return self.add_emulators(self.read_emulators(self.unloaded_emulators()))
+
+    def unloaded_emulators(self):
+        """Return the ids of the emulators whose games haven't been loaded."""
+        with self.lock:
+            return [emu_id for emu_id in self.emu_dict if not self.storage.is_loaded(emu_id)]
+
+    def all_loaded(self):
+        return not self.unloaded_emulators()
+
+    @timed('read_emulators')
+    def read_emulators(self, emu_ids):
+        """Read the games of emulators not loaded yet without adding them, safe on a background thread.
+
+        Returns {emulator id: (games, signature, ids of games whose notes were moved)} for add_emulators.
+        """
+        shards = {}
+        for emu_id in emu_ids:
+            if self.storage.is_loaded(emu_id):
+                continue
+            try:
+                games_dict, signature = self.storage.read_shard(emu_id)
+            except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+                self.on_error(f"Error loading games: {e}")
+                continue
+            shards[emu_id] = (games_dict, signature, self._store_notes(games_dict))
+        return shards
+
+    def add_emulators(self, shards):
+        """Add the games read by read_emulators, returns the ids of the games added.
+
+        Run on the thread the records are used from, in the window that is the UI thread. Only
+        the data lock is taken, so it never waits for a save being written.
+        """
+        added = []
+        moved = False
+        with self.lock:
+            for emu_id, (games_dict, signature, moved_ids) in shards.items():
+                if self.storage.is_loaded(emu_id):
+                    continue
+                self.storage.add_shard(emu_id, games_dict, signature)
+                # Games already here were merged in or changed since, they are newer than the shard
+                new_ids = [game_id for game_id in games_dict
+                           if game_id not in self.games_dict and game_id not in self.changed_games]
+                for game_id in new_ids:
+                    self.games_dict[game_id] = games_dict[game_id]
+                    self._index_game(game_id, games_dict[game_id])
+                self.changed_games.update(set(new_ids).intersection(moved_ids))
+                moved = moved or bool(moved_ids)
+                added += new_ids
+        if moved:
+            self.save_data()
+        return added
+
+    @timed('merge_external_changes')
+    def merge_external_changes(self):
+        """Load library files changed by another program and work out which records differ.
+
+        Runs on the watcher or writer thread without touching the records, the changes are
+        handed to apply_external_changes through the call_soon given to watch.
+        """
+        with self.io_lock:
+            if self.pending_merge is not None:
+                # Still waiting to be applied, look again once it is
+                self.merge_again = True
+                return
+            if not self.storage.changed_on_disk():
+                return
+            # Emulators loaded while the files are read aren't in what load returns, their games stay
+            covered = self.storage.loaded_ids()
+            try:
+                emu_dict, games_dict = self.storage.load()
+            except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+                self.on_error(f"Error loading changes made outside Retro Roaming: {e}")
+                return
+            moved = self._store_notes(games_dict)
+            # Records are replaced, never changed in place, so the diff can run without the lock
+            with self.lock:
+                old_emus = dict(self.emu_dict)
+                old_games = dict(self.games_dict)
+            emu_ids = {emu_id for emu_id in old_emus.keys() | emu_dict.keys()
+                       if old_emus.get(emu_id) != emu_dict.get(emu_id)}
+            game_ids = [game_id for game_id, details in games_dict.items() if old_games.get(game_id) != details]
+            game_ids += [game_id for game_id, details in old_games.items() if game_id not in games_dict
+                         and (covered is None or details['Emulator_id'] in covered)]
+            # Read here so the search index can be updated without reading files on the UI thread
+            notes = {game_id: self.notes_store.read(games_dict[game_id]['Notes_key'])
+                     for game_id in game_ids if game_id in games_dict}
+            # The writer waits for these to be applied, the storage already holds the new files' signatures
+            changes = self.pending_merge = (old_emus, old_games, emu_dict, games_dict, emu_ids, game_ids,
+                                            notes, set(moved))
+        self.call_soon(self.apply_external_changes, changes)
+
+    @timed('apply_external_changes')
+    def apply_external_changes(self, changes):
+        """Apply the records merge_external_changes found changed, on the thread the records are used from.
+
+        A record that also has unsaved changes here keeps them and is reported as a conflict,
+        the next save writes it back. Returns (emulator ids, game ids, conflicts) for what
+        was applied, or None if the changes had already been applied.
+        """
+        old_emus, old_games, emu_dict, games_dict, emu_ids, game_ids, notes, moved = changes
+        applied_emus = set()
+        applied_games = set()
+        conflicts = set()
+        with self.lock:
+            if self.pending_merge is not changes:
+                return None
+            self.pending_merge = None
+            for emu_id in emu_ids:
+                if emu_id in self.changed_emus or self.emu_dict.get(emu_id) is not old_emus.get(emu_id):
+                    conflicts.add(emu_id)
+                    continue
+                old = self.emu_dict.pop(emu_id, None)
+                if old is not None and self.emu_names.get(old['Name']) == emu_id:
+                    del self.emu_names[old['Name']]
+                if emu_id in emu_dict:
+                    self.emu_dict[emu_id] = emu_dict[emu_id]
+                    self.emu_names[emu_dict[emu_id]['Name']] = emu_id
+                    self.emu_index.setdefault(emu_id, set())
+                applied_emus.add(emu_id)
+            for game_id in game_ids:
+                current = self.games_dict.get(game_id)
+                if current is not None and current == games_dict.get(game_id):
+                    # Loaded here since the diff was taken, it already matches the file
+                    continue
+                if game_id in self.changed_games or current is not old_games.get(game_id):
+                    conflicts.add(game_id)
+                    continue
+                if current is not None:
+                    self._unindex_game(game_id, self.games_dict.pop(game_id))
+                if game_id in games_dict:
+                    details = self.games_dict[game_id] = games_dict[game_id]
+                    self._index_game(game_id, details, notes[game_id])
+                applied_games.add(game_id)
+            # Notes written into the files as text are saved back as a key
+            self.changed_games.update(applied_games & moved)
+            merge_again, self.merge_again = self.merge_again, False
+        perf_stats.count('external records merged', len(applied_emus) + len(applied_games))
+        perf_stats.count('external conflicts', len(conflicts))
+        # Saves wait while changes are pending, write anything held up
+        self.save_data()
+        if merge_again and self.watcher is not None:
+            threading.Thread(target=self.merge_external_changes, name='RetroRoamingMerge', daemon=True).start()
+        if (applied_emus or applied_games or conflicts) and self.on_external_change is not None:
+            self.on_external_change(applied_emus, applied_games, conflicts)
+        return applied_emus, applied_games, conflicts
+
+    @timed('save_data (write)')
+    def write_changes(self):
+        """Write the records changed since the last write, called on the writer thread."""
+        with self.io_lock:
+            # Notes first so a saved record never refers to notes that aren't on disk
+            try:
+                self.notes_store.flush()
+            except Exception as e:
+                self.on_error(f"Error saving notes: {e}")
+                return
+            with self.lock:
+                # Waiting for outside changes to be applied, apply_external_changes saves after them
+                if self.pending_merge is not None:
+                    return
+                if not self.changed_emus and not self.changed_games:
+                    return
+                changed_emus, self.changed_emus = self.changed_emus, set()
+                changed_games, self.changed_games = self.changed_games, set()
+                try:
+                    snapshot = self.storage.snapshot(self.emu_dict, self.games_dict, changed_emus, changed_games)
+                except Exception as e:
+                    self.changed_emus |= changed_emus
+                    self.changed_games |= changed_games
+                    self.on_error(f"Error saving data: {e}")
+                    return
+            try:
+                perf_stats.add_bytes('save_data', self.storage.save(snapshot))
+                return
+            except Exception as e:
+                # Put the changes back whatever went wrong so they are never lost, the next save tries them again
+                with self.lock:
+                    self.changed_emus |= changed_emus
+                    self.changed_games |= changed_games
+                if not isinstance(e, ExternalChangeError):
+                    self.on_error(f"Error saving data: {e}")
+                    return
+        # Someone else saved first, take in their changes then save ours on top
+        self.merge_external_changes()
+        self.save_data()
+
+    def build_indexes(self):
+        """Rebuild the emulator, name and search indexes from the records."""
+        self.emu_index = {emu_id: set() for emu_id in self.emu_dict}
+        self.emu_names = {details['Name']: emu_id for emu_id, details in self.emu_dict.items()}
+        self.name_index = {}
+        self.search_index = SearchIndex()
+        for game_id, details in self.games_dict.items():
+            self._index_game(game_id, details)
+
+    def _index_game(self, game_id, details, notes=''):
+        self.emu_index.setdefault(details['Emulator_id'], set()).add(game_id)
+        # Older libraries may hold two games with the same name, the first one wins the name slot
+        self.name_index.setdefault((details['Emulator_id'], details['Game']), game_id)
+        # Notes are left out when a whole library is indexed, index_notes adds them afterwards
+        self.search_index.add(game_id, details, notes)
+
+    @timed('index_notes')
+    def index_notes(self, game_ids=None, cancel=None):
+        """Add the notes of games indexed without them to the search index, None does every game.
+
+        Safe to run on a background thread, the notes are read without holding the lock.
+        """
+        with self.lock:
+            games = [(game_id, self.games_dict[game_id])
+                     for game_id in (list(self.games_dict) if game_ids is None else game_ids)
+                     if game_id in self.games_dict]
+        for game_id, details in games:
+            if cancel is not None and cancel.is_set():
+                return
+            if not details['Notes_key']:
+                continue
+            notes = self.notes_store.read(details['Notes_key'])
+            with self.lock:
+                # A game changed meanwhile was indexed with its notes when it changed
+                if self.games_dict.get(game_id) is details:
+                    self.search_index.add(game_id, details, notes)
+
+    def _unindex_game(self, game_id, details):
+        self.emu_index.get(details['Emulator_id'], set()).discard(game_id)
+        self.search_index.remove(game_id)
+        key = (details['Emulator_id'], details['Game'])
+        if self.name_index.get(key) == game_id:
+            del self.name_index[key]
+
+    def emulator_id(self, emu_name):
+        """Return the id of the emulator with this name, or None."""
+        return self.emu_names.get(emu_name)
+
+    def emulator_name(self, emu_id):
+        """Return the name of an emulator, or an empty string if there is no such emulator."""
+        details = self.emu_dict.get(emu_id)
+        return details['Name'] if details is not None else ''
+
+    def games_for_emulator(self, emu_id):
+        """Return the set of game ids belonging to an emulator."""
+        return self.emu_index.get(emu_id, set())
+
+    def find_game(self, emu_id, game_name):
+        """Return the id of the named game for an emulator, or None."""
+        return self.name_index.get((emu_id, game_name))
+
+    @timed('search')
+    def search(self, query):
+        """Return the ids of games in any emulator matching the query."""
+        # index_notes adds to the index on another thread, the candidates are taken under the lock
+        # and checked against their text, which may mean reading notes, after it is released
+        with self.lock:
+            games = {game_id: self.games_dict[game_id] for game_id in self.search_index.candidates(query)
+                     if game_id in self.games_dict}
+        return self.search_index.matches(query, games,
+                                         lambda game_id: self.notes_store.read(games[game_id]['Notes_key']))
+
+    def notes(self, game_id):
+        """Return a game's notes, read from the notes store the first time they are shown."""
+        return self.notes_store.get(self.games_dict[game_id]['Notes_key'])
+
+    def prune_notes(self):
+        """Delete stored notes no game refers to any more, returns how many were deleted.
+
+        Keys are taken from every game saved as well as those in memory, so the games of
+        emulators not loaded, or that have gone, keep their notes.
+        """
+        # Held throughout so the writer can't store notes between taking the keys and deleting
+        with self.io_lock:
+            keys = self.storage.notes_keys() if self.storage.exists() else set()
+            with self.lock:
+                keys.update(details['Notes_key'] for details in self.games_dict.values())
+            return self.notes_store.prune(keys)
+
+    # Records are replaced rather than changed in place so the writer can save
+    # from a shallow copy of the dictionaries taken under the lock.
+
+    def add_game(self, emu_id, game_name, options, notes=''):
+        """Add a new game record and return its id."""
+        game_id = str(uuid.uuid4())
+        details = GameRecord(game_name, emu_id, options, self.notes_store.put(notes))
+        # The emulator's other games are needed to keep the name index right
+        self.load_emulator(emu_id)
+        with self.lock:
+            self._put_game(game_id, details, notes)
+        return game_id
+
+    def _put_game(self, game_id, details, notes=''):
+        # Called with the data lock held and the emulator's games loaded
+        self.games_dict[game_id] = details
+        self._index_game(game_id, details, notes)
+        self.changed_games.add(game_id)
+
+    def import_games(self, found_files):
+        """Add a game for each (emulator id, file path) in one batch, returns how many were added.
+
+        Files already named in a game's options, or whose game name is taken, are skipped.
+        """
+        added = 0
+        found_files = list(found_files)
+        # Loaded before taking the data lock, nothing is loaded while it is held
+        for emu_id in {emu_id for emu_id, _path in found_files if emu_id in self.emu_dict}:
+            self.load_emulator(emu_id)
+        with self.lock:
+            known_paths = {}
+            for emu_id, path in found_files:
+                if emu_id not in self.emu_dict:
+                    continue
+                if emu_id not in known_paths:
+                    known_paths[emu_id] = {options_path for game_id in self.games_for_emulator(emu_id)
+                                           for options_path in re.findall(r'"([^"]+)"', self.games_dict[game_id]['Options'])}
+                game_name = LibraryScanner.game_name_from_file(path)
+                if path in known_paths[emu_id] or self.find_game(emu_id, game_name) is not None:
+                    continue
+                default_option = self.emu_dict[emu_id].get('Default_option', '')
+                self._put_game(str(uuid.uuid4()), GameRecord(game_name, emu_id, f' "{path}" {default_option}'))
+                known_paths[emu_id].add(path)
+                added += 1
+        if added:
+            self.save_data()
+        return added
+
+    def record_play(self, game_id, started, duration, exit_code):
+        """Add a finished session to a game's play statistics."""
+        if game_id not in self.games_dict:
+            return
+        details = self.games_dict[game_id]
+        self.update_game(game_id,
+                         Last_played=time.strftime('%Y-%m-%d %H:%M', time.localtime(started)),
+                         Play_count=details.get('Play_count', 0) + 1,
+                         Play_time=round(details.get('Play_time', 0) + duration),
+                         Last_exit_code=exit_code)
+        self.save_data()
+
+    def record_tests(self, results):
+        """Store LaunchTester results on the games, failed games keep Test_failed until they pass."""
+        tested = time.strftime('%Y-%m-%d %H:%M')
+        for game_id, (passed, result) in results.items():
+            if game_id in self.games_dict:
+                self.update_game(game_id, Last_tested=tested, Test_failed=not passed, Test_result=result)
+        self.save_data()
+
+    def update_game(self, game_id, **fields):
+        """Change fields such as Options or Notes on a game record.
+
+        New notes are queued in the notes store and written by the background writer, the record keeps their key.
+        """
+        notes = fields.pop('Notes', None)
+        if notes is not None:
+            fields['Notes_key'] = self.notes_store.put(notes)
+        with self.lock:
+            old = self.games_dict[game_id]
+            details = old.replace(**fields)
+            if details == old:
+                return
+            self.games_dict[game_id] = details
+            if any(field in SearchIndex.FIELDS or field == 'Notes_key' for field in fields):
+                self.search_index.add(game_id, details, self.notes_store.get(details['Notes_key']))
+            self.changed_games.add(game_id)
+
+    def rename_game(self, game_id, new_name):
+        """Change the name of a game keeping the name index in step."""
+        with self.lock:
+            details = self.games_dict[game_id]
+            self._unindex_game(game_id, details)
+            details = self.games_dict[game_id] = details.replace(Game=new_name)
+            self._index_game(game_id, details, self.notes_store.get(details['Notes_key']))
+            self.changed_games.add(game_id)
+
+    def delete_game(self, game_id):
+        """Remove a game record."""
+        with self.lock:
+            details = self.games_dict.pop(game_id)
+            self._unindex_game(game_id, details)
+            self.changed_games.add(game_id)
+
+    def add_emulator(self, emu_name, details):
+        """Add a new emulator record and return its id."""
+        emu_id = str(uuid.uuid4())
+        with self.lock:
+            self.emu_dict[emu_id] = {'Name': emu_name, **details}
+            self.emu_names[emu_name] = emu_id
+            self.emu_index.setdefault(emu_id, set())
+            self.changed_emus.add(emu_id)
+        return emu_id
+
+    def update_emulator(self, emu_id, **fields):
+        """Change fields such as Name, Location or Default_option on an emulator record."""
+        with self.lock:
+            old_name = self.emu_dict[emu_id]['Name']
+            details = self.emu_dict[emu_id] = {**self.emu_dict[emu_id], **fields}
+            if details['Name'] != old_name:
+                if self.emu_names.get(old_name) == emu_id:
+                    del self.emu_names[old_name]
+                self.emu_names[details['Name']] = emu_id
+            self.changed_emus.add(emu_id)
+
+    def rename_emulator(self, emu_id, new_name):
+        """Rename an emulator, its games refer to it by id so only the emulator record changes."""
+        self.update_emulator(emu_id, Name=new_name)
+
+    def delete_emulator(self, emu_id):
+        """Remove an emulator and all the games set up for it."""
+        self.load_emulator(emu_id)
+        with self.lock:
+            for game_id in self.emu_index.pop(emu_id, set()):
+                details = self.games_dict.pop(game_id)
+                key = (emu_id, details['Game'])
+                if self.name_index.get(key) == game_id:
+                    del self.name_index[key]
+                self.search_index.remove(game_id)
+                self.changed_games.add(game_id)
+            details = self.emu_dict.pop(emu_id)
+            if self.emu_names.get(details['Name']) == emu_id:
+                del self.emu_names[details['Name']]
+            self.changed_emus.add(emu_id)
@@ -0,0 +1,151 @@
+#
+# Retro Roaming performance counters - call counts, latencies and bytes written for the hot paths.
+#
+# Recording is off unless RETROROAMING_PERF=1 is set or it is switched on from the Help menu,
+# when off a timed call costs one attribute check. RETROROAMING_PROFILE=1 (or a file name)
+# also runs cProfile for the session and writes the stats when the program closes.
+#
+import collections
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+
+# How many recent latencies are kept per name for the percentiles
+SAMPLE_SIZE = 2000
+
+
+class PerfStats:
+    """Collects timings and counters by name, safe to use from any thread."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = collections.Counter()
+            self.total = collections.Counter()
+            self.worst = {}
+            self.samples = collections.defaultdict(lambda: collections.deque(maxlen=SAMPLE_SIZE))
+            self.bytes_written = collections.Counter()
+            self.counters = collections.Counter()
+            self.started = time.time()
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.calls[name] += 1
+            self.total[name] += seconds
+            self.samples[name].append(seconds)
+            if seconds > self.worst.get(name, 0):
+                self.worst[name] = seconds
+
+    def add_bytes(self, name, count):
+        if self.enabled:
+            with self.lock:
+                self.bytes_written[name] += count
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += amount
+
+    @staticmethod
+    def percentile(sorted_samples, fraction):
+        return sorted_samples[min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))]
+
+    def summary(self):
+        """Return a text table of everything recorded so far."""
+        with self.lock:
+            lines = [f"Recording {'on' if self.enabled else 'off'}, "
+                     f"{time.time() - self.started:.0f}s since the counters were reset", "",
+                     f"{'name':<26}{'calls':>8}{'total ms':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+            for name in sorted(self.calls, key=lambda n: self.total[n], reverse=True):
+                samples = sorted(self.samples[name])
+                lines.append(f"{name:<26}{self.calls[name]:>8}{self.total[name] * 1000:>11.1f}"
+                             f"{self.percentile(samples, 0.50) * 1000:>9.2f}"
+                             f"{self.percentile(samples, 0.95) * 1000:>9.2f}"
+                             f"{self.percentile(samples, 0.99) * 1000:>9.2f}"
+                             f"{self.worst[name] * 1000:>9.2f}")
+            if self.bytes_written:
+                lines += ["", f"{'bytes written':<26}{'total':>14}"]
+                lines += [f"{name:<26}{count:>14,}" for name, count in sorted(self.bytes_written.items())]
+            if self.counters:
+                lines += ["", f"{'counter':<26}{'total':>14}"]
+                lines += [f"{name:<26}{count:>14,}" for name, count in sorted(self.counters.items())]
+        return '\n'.join(lines)
+
+
+stats = PerfStats(enabled=os.getenv('RETROROAMING_PERF', '') not in ('', '0'))
+
+
+def timed(name):
+    """Decorator recording how long each call takes under name while recording is on."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not stats.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+class SessionProfile:
+    """Runs cProfile for the whole session when RETROROAMING_PROFILE is set.
+
+    Threads started while profiling get a profiler of their own, their stats are merged into
+    one file on stop. From Python 3.12 one profiler already sees every thread.
+    """
+
+    def __init__(self, folder):
+        setting = os.getenv('RETROROAMING_PROFILE', '')
+        self.profiler = None
+        self.path = ''
+        self.thread_profilers = []
+        self.lock = threading.Lock()
+        if setting in ('', '0'):
+            return
+        if setting == '1':
+            setting = os.path.join(folder, time.strftime('profile-%Y%m%d-%H%M%S.prof'))
+        self.path = setting
+        self.profiler = cProfile.Profile()
+        if sys.version_info < (3, 12):
+            # Called once as each new thread starts, it swaps itself for the thread's own profiler
+            threading.setprofile(self._profile_thread)
+        self.profiler.enable()
+
+    def _profile_thread(self, frame, event, arg):
+        profiler = cProfile.Profile()
+        with self.lock:
+            if self.profiler is None:
+                sys.setprofile(None)
+                return
+            self.thread_profilers.append(profiler)
+        profiler.enable()
+
+    def stop(self):
+        """Stop profiling and write the stats, returns the file written or ''."""
+        if self.profiler is None:
+            return ''
+        threading.setprofile(None)
+        self.profiler.disable()
+        with self.lock:
+            profilers, self.thread_profilers = self.thread_profilers, []
+            stats = pstats.Stats(self.profiler)
+            self.profiler = None
+        for profiler in profilers:
+            # Threads still running keep their profiler, the stats are those up to now
+            profiler.create_stats()
+            if profiler.stats:
+                stats.add(profiler)
+        stats.dump_stats(self.path)
+        return self.path
@@ -0,0 +1,18 @@
+"""Shared set up for the tests, a DataManager on a temporary folder with one emulator."""
+import retro_core
+
+EMULATOR = {'Location': 'C:\\Emulators\\Fuse\\fuse.exe', 'Library_default': '', 'Default_option': '-fs',
+            'Working_Directory': ''}
+
+
+def new_library(folder, games=(), storage='json', monkeypatch=None):
+    """Return (data manager, emulator id) for a library holding the (name, options, notes) games given."""
+    if monkeypatch is not None:
+        monkeypatch.setenv('RETROROAMING_STORAGE', storage)
+    data_manager = retro_core.DataManager(datastorelocation=str(folder))
+    emu_id = data_manager.add_emulator('Fuse', dict(EMULATOR))
+    for name, options, notes in games:
+        data_manager.add_game(emu_id, name, options, notes)
+    data_manager.save_data()
+    data_manager.flush()
+    return data_manager, emu_id
@@ -0,0 +1,93 @@
+import json
+import os
+
+from tests.helpers import new_library
+
+
+def edit_outside(folder, change):
+    """Change games_data.json the way another program would."""
+    path = os.path.join(folder, 'games_data.json')
+    with open(path) as gf:
+        games = json.load(gf)
+    change(games)
+    with open(path, 'w') as gf:
+        json.dump(games, gf, indent=2)
+    # Make sure the change shows even on file systems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_outside_changes_are_merged(tmp_path):
+    data_manager, emu_id = new_library(tmp_path, [('Elite', '', ''), ('Doom', '', '')])
+    changed = []
+    data_manager.on_external_change = lambda *args: changed.append(args)
+    elite = data_manager.find_game(emu_id, 'Elite')
+    doom = data_manager.find_game(emu_id, 'Doom')
+
+    def change(games):
+        games[elite]['Options'] = '-outside'
+        del games[doom]
+
+    edit_outside(tmp_path, change)
+    data_manager.merge_external_changes()
+    try:
+        assert data_manager.games_dict[elite]['Options'] == '-outside'
+        assert doom not in data_manager.games_dict
+        assert data_manager.find_game(emu_id, 'Doom') is None
+        assert changed and changed[0][2] == set()
+    finally:
+        data_manager.close()
+
+
+def test_local_unsaved_changes_win_a_conflict(tmp_path):
+    data_manager, emu_id = new_library(tmp_path, [('Elite', '', ''), ('Doom', '', '')])
+    elite = data_manager.find_game(emu_id, 'Elite')
+    doom = data_manager.find_game(emu_id, 'Doom')
+    data_manager.update_game(elite, Options='-local')
+
+    def change(games):
+        games[elite]['Options'] = '-outside'
+        games[doom]['Options'] = '-outside'
+
+    changed = []
+    data_manager.on_external_change = lambda *args: changed.append(args)
+    edit_outside(tmp_path, change)
+    data_manager.merge_external_changes()
+    _emu_ids, game_ids, conflicts = changed[0]
+    assert game_ids == {doom} and conflicts == {elite}
+    assert data_manager.games_dict[elite]['Options'] == '-local'
+    data_manager.close()
+    saved = json.loads((tmp_path / 'games_data.json').read_text())
+    assert saved[elite]['Options'] == '-local'
+    assert saved[doom]['Options'] == '-outside'
+
+
+def test_merge_is_applied_through_call_soon(tmp_path):
+    data_manager, emu_id = new_library(tmp_path, [('Elite', '', '')])
+    queued = []
+    data_manager.call_soon = lambda function, *args: queued.append((function, args))
+    elite = data_manager.find_game(emu_id, 'Elite')
+    edit_outside(tmp_path, lambda games: games[elite].update(Options='-outside'))
+    data_manager.merge_external_changes()
+    # Nothing changes until the queued call runs on the records' thread
+    assert data_manager.games_dict[elite]['Options'] == ''
+    function, args = queued.pop()
+    _emu_ids, game_ids, conflicts = function(*args)
+    assert game_ids == {elite} and not conflicts
+    assert data_manager.games_dict[elite]['Options'] == '-outside'
+    data_manager.close()
+
+
+def test_close_saves_local_changes_over_outside_ones(tmp_path):
+    data_manager, emu_id = new_library(tmp_path, [('Elite', '', ''), ('Doom', '', '')])
+    # A window that has gone never runs what call_soon queues
+    data_manager.call_soon = lambda function, *args: None
+    elite = data_manager.find_game(emu_id, 'Elite')
+    doom = data_manager.find_game(emu_id, 'Doom')
+    data_manager.update_game(elite, Options='-local')
+    data_manager.save_data()
+    edit_outside(tmp_path, lambda games: games[doom].update(Options='-outside'))
+    data_manager.close()
+    saved = json.loads((tmp_path / 'games_data.json').read_text())
+    assert saved[elite]['Options'] == '-local'
+    assert saved[doom]['Options'] == '-outside'
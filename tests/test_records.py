@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from retro_core import DataManager, GameRecord, JsonStorage
+from tests.helpers import new_library
+
+
+def test_record_reads_like_its_dict():
+    record = GameRecord('Manic Miner', 'emu-1', ' "D:\\mm.tzx"', 'abc', {'Plays': 3})
+    assert record['Game'] == 'Manic Miner'
+    assert record['Emulator_id'] == 'emu-1'
+    assert record.get('Plays') == 3
+    assert record.get('Missing', 'default') == 'default'
+    assert 'Plays' in record and 'Missing' not in record
+    with pytest.raises(KeyError):
+        record['Missing']
+
+
+def test_record_round_trips_through_json():
+    record = GameRecord('Jet Set Willy', 'emu-1', '-fs', 'abc', {'Plays': 3})
+    saved = json.loads(json.dumps({'g': record}, default=GameRecord.to_dict))
+    assert GameRecord.from_dict(saved['g']) == record
+    assert saved['g'] == {'Game': 'Jet Set Willy', 'Emulator_id': 'emu-1', 'Options': '-fs',
+                          'Notes_key': 'abc', 'Plays': 3}
+
+
+def test_replace_returns_a_changed_copy():
+    record = GameRecord('Elite', 'emu-1', '')
+    changed = record.replace(Options='-fs')
+    assert changed['Options'] == '-fs' and record['Options'] == ''
+
+
+def test_old_name_keyed_games_keep_their_emulator_name(tmp_path):
+    (tmp_path / 'emu_data.json').write_text(json.dumps(
+        {'Fuse': {'Location': 'fuse', 'Library_default': '', 'Default_option': '', 'Working_Directory': ''}}))
+    (tmp_path / 'games_data.json').write_text(json.dumps(
+        {'g1': {'Game': 'Elite', 'Application': 'Fuse', 'Options': '', 'Notes': 'dock slowly'},
+         'g2': {'Game': 'Doom', 'Application': 'DOSBox', 'Options': '', 'Notes': ''}}))
+    emu_dict, games_dict = JsonStorage(str(tmp_path)).load()
+    names = {emu_id: details['Name'] for emu_id, details in emu_dict.items()}
+    assert names[games_dict['g1']['Emulator_id']] == 'Fuse'
+    # The emulator has gone, the game is kept under one of that name with no location
+    assert names[games_dict['g2']['Emulator_id']] == 'DOSBox'
+    assert emu_dict[games_dict['g2']['Emulator_id']]['Location'] == ''
+
+
+@pytest.mark.parametrize('storage', ['json', 'sharded', 'sqlite'])
+def test_library_round_trips_through_storage(tmp_path, monkeypatch, storage):
+    data_manager, emu_id = new_library(tmp_path, [('Elite', '-fs', 'dock slowly'), ('Doom', '', '')],
+                                       storage, monkeypatch)
+    data_manager.close()
+    reloaded = DataManager(datastorelocation=str(tmp_path))
+    try:
+        assert type(reloaded.storage).__name__.lower().startswith(storage)
+        game_id = reloaded.find_game(emu_id, 'Elite')
+        assert reloaded.games_dict[game_id]['Options'] == '-fs'
+        assert reloaded.notes(game_id) == 'dock slowly'
+        assert len(reloaded.games_for_emulator(emu_id)) == 2
+    finally:
+        reloaded.close()
+
+
+def test_unsaved_changes_survive_a_failed_save(tmp_path):
+    errors = []
+    data_manager, emu_id = new_library(tmp_path)
+    data_manager.on_error = errors.append
+    data_manager.writer.on_error = errors.append
+    save = data_manager.storage.save
+
+    def failing_save(snapshot):
+        raise ValueError("disk on fire")
+
+    data_manager.storage.save = failing_save
+    game_id = data_manager.add_game(emu_id, 'Elite', '')
+    data_manager.save_data()
+    data_manager.flush()
+    assert errors and game_id in data_manager.changed_games
+    data_manager.storage.save = save
+    data_manager.save_data()
+    data_manager.close()
+    assert 'Elite' in (tmp_path / 'games_data.json').read_text()
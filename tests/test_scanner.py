@@ -0,0 +1,63 @@
+import json
+import os
+
+from retro_core import LibraryScanner
+from tests.helpers import new_library
+
+
+def make_library(folder):
+    library = folder / 'library'
+    (library / 'sub').mkdir(parents=True)
+    for name in ('Manic_Miner.tzx', 'sub/Jet_Set_Willy.tap', 'readme.txt'):
+        (library / name).write_text('x')
+    return library
+
+
+def scan(folder, emu_dict, full=False):
+    scanner = LibraryScanner(str(folder / 'scan_cache.json'), workers=2)
+    found = scanner.scan(emu_dict, full=full)
+    scanner.save_cache()
+    return sorted(LibraryScanner.game_name_from_file(path) for _emu_id, path in found)
+
+
+def test_extensions_and_names():
+    assert LibraryScanner.extensions_for({'Scan_extensions': 'tzx, .TAP;z80'}) == {'.tzx', '.tap', '.z80'}
+    assert LibraryScanner.game_name_from_file(os.path.join('games', 'Manic_Miner.tzx')) == 'Manic Miner'
+
+
+def test_rescan_only_offers_new_files(tmp_path):
+    library = make_library(tmp_path)
+    emu_dict = {'e': {'Library_default': str(library), 'Scan_extensions': 'tzx tap'}}
+    assert scan(tmp_path, emu_dict) == ['Jet Set Willy', 'Manic Miner']
+    assert scan(tmp_path, emu_dict) == []
+    (library / 'sub' / 'Skool_Daze.tap').write_text('x')
+    assert scan(tmp_path, emu_dict) == ['Skool Daze']
+    assert scan(tmp_path, emu_dict, full=True) == ['Jet Set Willy', 'Manic Miner', 'Skool Daze']
+
+
+def test_new_extensions_and_emulators_see_files_already_scanned(tmp_path):
+    library = make_library(tmp_path)
+    assert scan(tmp_path, {'e': {'Library_default': str(library), 'Scan_extensions': 'tzx'}}) == ['Manic Miner']
+    assert scan(tmp_path, {'e': {'Library_default': str(library), 'Scan_extensions': 'tzx tap'}}) == \
+        ['Jet Set Willy', 'Manic Miner']
+    assert scan(tmp_path, {'f': {'Library_default': str(library), 'Scan_extensions': 'tap'}}) == ['Jet Set Willy']
+    # Emulators left out of a scan keep their cached listings
+    assert set(json.loads((tmp_path / 'scan_cache.json').read_text())) == {'e:.tap,.tzx', 'f:.tap'}
+
+
+def test_old_path_keyed_cache_is_dropped(tmp_path):
+    library = make_library(tmp_path)
+    (tmp_path / 'scan_cache.json').write_text(json.dumps(
+        {str(library): {'mtime': 0, 'files': [['Manic_Miner.tzx', 1]], 'dirs': []}}))
+    assert scan(tmp_path, {'e': {'Library_default': str(library), 'Scan_extensions': 'tzx'}}) == ['Manic Miner']
+
+
+def test_import_skips_files_already_set_up(tmp_path):
+    library = make_library(tmp_path)
+    data_manager, emu_id = new_library(tmp_path / 'data')
+    try:
+        found = [(emu_id, str(library / 'Manic_Miner.tzx'))]
+        assert data_manager.import_games(found) == 1
+        assert data_manager.import_games(found) == 0
+    finally:
+        data_manager.close()
@@ -0,0 +1,47 @@
+from retro_core import GameRecord, SearchIndex
+from tests.helpers import new_library
+
+
+def build_index(games):
+    index = SearchIndex()
+    records = {}
+    for game_id, (name, options, notes) in games.items():
+        records[game_id] = GameRecord(name, 'emu-1', options)
+        index.add(game_id, records[game_id], notes)
+    return index, records
+
+
+def test_search_matches_every_word_in_any_field():
+    index, records = build_index({'a': ('Manic Miner', '"D:\\spectrum\\mm.tzx"', ''),
+                                  'b': ('Jet Set Willy', '', 'sequel to manic miner'),
+                                  'c': ('Elite', '', '')})
+    notes = {'b': 'sequel to manic miner'}
+    assert index.search('manic', records, notes.get) == {'a', 'b'}
+    assert index.search('MINER spectrum', records, notes.get) == {'a'}
+    assert index.search('elite', records, notes.get) == {'c'}
+    assert index.search('xyz', records, notes.get) == set()
+    assert index.search('', records, notes.get) == set()
+
+
+def test_removed_and_readded_games_are_found_by_their_new_text():
+    index, records = build_index({'a': ('Manic Miner', '', '')})
+    index.add('a', records['a'], 'now with notes')
+    assert index.search('notes', records, lambda game_id: 'now with notes') == {'a'}
+    index.remove('a')
+    assert index.search('manic', records) == set()
+
+
+def test_short_terms_still_match():
+    index, records = build_index({'a': ('Q*bert', '', ''), 'b': ('Qix', '', '')})
+    assert index.search('q', records) == {'a', 'b'}
+
+
+def test_data_manager_search_covers_notes(tmp_path):
+    data_manager, emu_id = new_library(tmp_path, [('Elite', '', 'dock slowly'), ('Doom', '', '')])
+    try:
+        data_manager.index_notes()
+        assert data_manager.search('dock') == {data_manager.find_game(emu_id, 'Elite')}
+        data_manager.update_game(data_manager.find_game(emu_id, 'Doom'), Notes='idkfa')
+        assert data_manager.search('idkfa') == {data_manager.find_game(emu_id, 'Doom')}
+    finally:
+        data_manager.close()